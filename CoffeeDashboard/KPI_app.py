@@ -1,29 +1,29 @@
 import streamlit as st
-import pandas as pd
-import json
 import matplotlib.pyplot as plt
+from data_loader import load_dataset
+from aggregates import aggregate_periods
+from diagnostics import begin_app, end_app, stage
 
 # Tùy chỉnh layout
 st.set_page_config(layout="wide")
 st.title("📊 KPI Dashboard Doanh Số Cà Phê")
 
-# Đọc dữ liệu từ file Excel
-df = pd.read_excel("kf_coffee.csv", sheet_name="Trang tính1")
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("KPI_app")
 
-# Hàm tính số lượng bán trong khoảng ngày
-def sum_stock_decreased_in_range(stock_history_str, start_date, end_date):
-    try:
-        history = json.loads(stock_history_str).get("stock_history", [])
-        return sum(float(entry.get("stock_decreased", 0))
-                   for entry in history if start_date <= entry["date"] <= end_date)
-    except:
-        return 0
+# Đọc dữ liệu (đã ingest, cache dùng chung)
+df, movements = load_dataset("kf_coffee.csv")
 
-# Tính số lượng bán theo các giai đoạn
-df["Tuan_1"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-14"))
-df["Tuan_2"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-15", "2025-03-22"))
-df["Tuan_3"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-23", "2025-03-28"))
-df["Ca_thang"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-28"))
+# Các giai đoạn (tên kỳ, ngày bắt đầu, ngày kết thúc)
+periods = [
+    ("Tuan_1", "2025-03-07", "2025-03-14"),
+    ("Tuan_2", "2025-03-15", "2025-03-22"),
+    ("Tuan_3", "2025-03-23", "2025-03-28"),
+    ("Ca_thang", "2025-03-07", "2025-03-28"),
+]
+
+# Tính số lượng bán theo các giai đoạn trong một lần tổng hợp
+df[[name for name, _, _ in periods]] = aggregate_periods(df, movements, periods)
 
 # Tên các giai đoạn
 period_label = {
@@ -72,4 +72,7 @@ ax.bar(top_products["name"], top_products["doanh_thu"], color="#4CAF50")
 ax.set_title("Top 10 sản phẩm doanh thu cao", fontsize=14)
 ax.set_ylabel("Doanh thu (VNĐ)")
 ax.set_xticklabels(top_products["name"], rotation=45, ha='right')
-st.pyplot(fig)
+with stage("render"):
+    st.pyplot(fig)
+
+end_app()
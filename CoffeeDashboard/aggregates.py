@@ -0,0 +1,302 @@
+import heapq
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from diagnostics import instrument
+from schema import EPOCH, day_offset, movement_days
+
+
+# Hàm tổng hợp theo nhiều kỳ: gộp theo (sản phẩm, ngày) một lần, cộng dồn, rồi lấy tổng mỗi kỳ
+# bằng searchsorted trên hai đầu kỳ, nên chi phí không nhân với số kỳ
+# periods: danh sách (tên kỳ, ngày bắt đầu, ngày kết thúc), hai đầu đều được tính
+# Kết quả: bảng sản phẩm × kỳ, cùng index với bảng products
+def aggregate_periods(products, movements, periods, column="stock_decreased"):
+    names = [name for name, _, _ in periods]
+    starts = np.array([day_offset(start) for _, start, _ in periods], dtype=np.int64)
+    ends = np.array([day_offset(end) for _, _, end in periods], dtype=np.int64)
+
+    # Ngày lỗi không thuộc kỳ nào
+    days, valid = movement_days(movements)
+    values = movements[column].to_numpy(dtype=np.float64)[valid]
+    daily = pd.Series(values).groupby([movements["product_id"].to_numpy()[valid], days[valid]]).sum()
+    sums = pd.DataFrame(0.0, index=[], columns=names)
+    if len(daily):
+        # daily đã sắp theo (sản phẩm, ngày); khóa phẳng mã sản phẩm × span + ngày cũng tăng dần
+        ids, codes = np.unique(daily.index.get_level_values(0).to_numpy(), return_inverse=True)
+        day_values = daily.index.get_level_values(1).to_numpy()
+        first = int(day_values.min())
+        span = int(day_values.max()) - first + 1
+        keys = codes * span + (day_values - first)
+        cumulative = np.concatenate([[0.0], np.cumsum(daily.to_numpy())])
+
+        # Kỳ [start, end] của sản phẩm thứ c là các khóa trong [c*span + lo, c*span + hi)
+        lo = np.clip(starts - first, 0, span)
+        hi = np.clip(ends - first + 1, lo, span)
+        base = (np.arange(len(ids)) * span)[:, None]
+        sums = pd.DataFrame(cumulative[np.searchsorted(keys, base + hi)] - cumulative[np.searchsorted(keys, base + lo)],
+                            index=ids, columns=names)
+    result = sums.reindex(products["product_id"], fill_value=0.0)
+    result.index = products.index
+    return result
+
+
+# Chỉ mục tổng tích lũy (prefix sum) theo ngày cho từng sản phẩm
+# cumulative[:, j] là tổng từ ngày đầu tiên đến trước ngày thứ j, nên tổng của
+# một khoảng ngày bất kỳ chỉ là một phép trừ hai cột
+class PrefixSumIndex:
+    def __init__(self, products, movements, column="stock_decreased"):
+        self.product_index = products.index
+        days, valid = movement_days(movements)
+        if not valid.any():
+            self.first_date = self.last_date = pd.Timestamp.today().normalize()
+            self.cumulative = np.zeros((len(products), 2))
+            return
+
+        days = days[valid]
+        first, last = int(days.min()), int(days.max())
+        self.first_date = EPOCH + pd.Timedelta(days=first)
+        self.last_date = EPOCH + pd.Timedelta(days=last)
+        n_days = last - first + 1
+
+        # Vị trí dòng của sản phẩm và cột của ngày, cộng dồn bằng bincount trên chỉ số phẳng
+        rows = pd.Index(products["product_id"]).get_indexer(movements["product_id"].to_numpy()[valid])
+        cols = days - first
+        keep = rows >= 0
+        flat = rows[keep] * n_days + cols[keep]
+        daily = np.bincount(flat, weights=movements[column].to_numpy(dtype=np.float64)[valid][keep],
+                            minlength=len(products) * n_days).reshape(len(products), n_days)
+
+        self.cumulative = np.zeros((len(products), n_days + 1))
+        np.cumsum(daily, axis=1, out=self.cumulative[:, 1:])
+
+    # Hàm tạo chỉ mục từ ma trận tích lũy có sẵn (ví dụ của kho tăng dần)
+    @classmethod
+    def from_cumulative(cls, product_index, first_date, cumulative):
+        index = cls.__new__(cls)
+        index.product_index = product_index
+        index.first_date = first_date
+        index.last_date = first_date + pd.Timedelta(days=cumulative.shape[1] - 2)
+        index.cumulative = cumulative
+        return index
+
+    # Hàm đổi ngày thành vị trí cột trong ma trận tích lũy (kẹp vào phạm vi dữ liệu)
+    def _position(self, date):
+        offset = (pd.Timestamp(date).normalize() - self.first_date).days
+        return min(max(offset, 0), self.cumulative.shape[1] - 1)
+
+    # Tổng của từng sản phẩm trong khoảng [start, end], O(1) cho mỗi sản phẩm
+    def range_sum(self, start, end):
+        lo = self._position(start)
+        hi = self._position(pd.Timestamp(end) + pd.Timedelta(days=1))
+        if hi <= lo:
+            return pd.Series(0.0, index=self.product_index)
+        return pd.Series(self.cumulative[:, hi] - self.cumulative[:, lo], index=self.product_index)
+
+
+# Các kiểu chia kỳ cho bộ chọn khoảng ngày
+PERIOD_FREQUENCIES = {
+    "daily": "Theo ngày",
+    "weekly": "Theo tuần",
+    "monthly": "Theo tháng",
+    "rolling": "Cuốn chiếu N ngày",
+}
+
+
+# Hàm chia khoảng [start, end] thành các kỳ (nhãn, ngày bắt đầu, ngày kết thúc)
+# weekly: các khối 7 ngày tính từ start; monthly: tháng dương lịch cắt theo khoảng;
+# rolling: cửa sổ window ngày nằm trọn trong khoảng, trượt từng ngày
+# Nhãn ngày có kèm năm để các kỳ của các năm khác nhau không trùng nhãn
+def make_periods(start, end, freq="weekly", window=7):
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    if end < start:
+        return []
+
+    if freq == "daily":
+        return [(f"Ngày {day:%d/%m/%Y}", day, day) for day in pd.date_range(start, end)]
+
+    if freq == "weekly":
+        periods = []
+        for i, week_start in enumerate(pd.date_range(start, end, freq="7D"), start=1):
+            week_end = min(week_start + pd.Timedelta(days=6), end)
+            periods.append((f"Tuần {i} ({week_start:%d/%m} → {week_end:%d/%m})", week_start, week_end))
+        return periods
+
+    if freq == "monthly":
+        periods = []
+        month_start = start
+        while month_start <= end:
+            month_end = min(month_start + pd.offsets.MonthEnd(0), end)
+            periods.append((f"Tháng {month_start:%m/%Y} ({month_start:%d/%m} → {month_end:%d/%m})",
+                            month_start, month_end))
+            month_start = month_end + pd.Timedelta(days=1)
+        return periods
+
+    if freq == "rolling":
+        window = max(int(window), 1)
+        span = pd.Timedelta(days=window - 1)
+        return [(f"{day - span:%d/%m/%Y} → {day:%d/%m/%Y}", day - span, day)
+                for day in pd.date_range(start + span, end)]
+
+    raise ValueError(f"Kiểu chia kỳ không hợp lệ: {freq}")
+
+
+# Các cột phân loại sản phẩm được tổng hợp sẵn (nếu có trong bảng sản phẩm)
+CATEGORY_COLUMNS = ["packaging", "coffee_type"]
+
+# Số kết quả truy vấn giữ lại trong mỗi kho tổng hợp
+QUERY_CACHE_SIZE = 256
+
+
+# Cache kết quả truy vấn (LRU) của một kho, dùng chung giữa các luồng/phiên
+# Mọi thao tác trên OrderedDict đều nằm trong khóa; compute chạy ngoài khóa nên hai luồng có thể
+# cùng tính một khóa, khi đó kết quả ghi sau thay kết quả ghi trước (hai kết quả như nhau)
+class QueryCache:
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Khi gửi kho sang tiến trình khác (report.py), cache được tạo mới thay vì sao chép
+    def __reduce__(self):
+        return QueryCache, (self.size,)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+    # Hàm lấy kết quả từ cache, tính bằng compute nếu chưa có
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+
+# Kho tổng hợp dựng sẵn một lần lúc ingest: số lượng bán theo sản phẩm × ngày (dạng
+# tích lũy), doanh thu = số lượng × giá, và bảng cộng dồn theo từng loại sản phẩm
+# Mọi tab trả lời truy vấn bằng cách cắt các mảng này thay vì groupby lại dữ liệu thô
+# units, total_units: chỉ mục tích lũy và tổng bán dựng sẵn (kho tăng dần); khi có thì
+# bảng biến động không được đọc
+class AggregateStore:
+    @instrument("aggregate")
+    def __init__(self, products, movements, units=None, total_units=None):
+        self.products = products.reset_index(drop=True)
+        self.units = PrefixSumIndex(self.products, movements, "stock_decreased") if units is None else units
+        self.first_date = self.units.first_date
+        self.last_date = self.units.last_date
+        # Giá thiếu được tính là 0, giống phép sum bỏ qua NaN
+        price = self.products["price"] if "price" in self.products else pd.Series(0.0, index=self.products.index)
+        self.price = pd.to_numeric(price, errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+
+        # Tổng toàn thời gian (kể cả các mục có ngày lỗi)
+        # Cộng bằng float64 vì bảng biến động dạng gọn lưu số lượng bằng kiểu hẹp (int8, float32...)
+        if total_units is None:
+            totals = movements["stock_decreased"].astype(np.float64).groupby(movements["product_id"].to_numpy()).sum()
+            total_units = totals.reindex(self.products["product_id"], fill_value=0.0).to_numpy(dtype=np.float64)
+        self.total_units = total_units
+
+        # Bảng tích lũy theo loại: số lượng và doanh thu của mỗi nhóm theo ngày
+        self.categories = {}
+        for dimension in CATEGORY_COLUMNS:
+            if dimension in self.products:
+                self.add_dimension(dimension)
+        self._cache = QueryCache()
+
+    # Hàm dựng bảng tích lũy cho một cột phân loại
+    def add_dimension(self, dimension):
+        codes, labels = pd.factorize(self.products[dimension], use_na_sentinel=False)
+        cumulative = self.units.cumulative
+        self.categories[dimension] = (
+            pd.Index(labels, name=dimension),
+            pd.DataFrame(cumulative).groupby(codes).sum().to_numpy(),
+            pd.DataFrame(cumulative * self.price[:, None]).groupby(codes).sum().to_numpy(),
+            np.bincount(codes, weights=self.total_units, minlength=len(labels)),
+            np.bincount(codes, weights=self.total_units * self.price, minlength=len(labels)),
+        )
+        self._cache = QueryCache()
+
+    # Hàm khóa ghi các mảng tổng hợp: kho được dùng chung giữa các phiên nên phải chỉ đọc
+    def freeze(self):
+        arrays = [self.units.cumulative, self.price, self.total_units]
+        for _, *category_arrays in self.categories.values():
+            arrays.extend(category_arrays)
+        for array in arrays:
+            array.flags.writeable = False
+        return self
+
+    # Hàm đổi (start, end) thành vị trí cột trong ma trận tích lũy, None = toàn thời gian
+    def _bounds(self, start, end):
+        if start is None and end is None:
+            return None
+        lo = self.units._position(self.first_date if start is None else start)
+        hi = self.units._position(pd.Timestamp(self.last_date if end is None else end) + pd.Timedelta(days=1))
+        return lo, max(hi, lo)
+
+    # Số lượng bán và doanh thu của từng sản phẩm trong khoảng ngày (None = toàn thời gian)
+    def product_totals(self, start=None, end=None):
+        bounds = self._bounds(start, end)
+
+        def compute():
+            if bounds is None:
+                units = self.total_units
+            else:
+                units = self.units.cumulative[:, bounds[1]] - self.units.cumulative[:, bounds[0]]
+            return pd.DataFrame({
+                "product_id": self.products["product_id"].to_numpy(),
+                "name": self.products["name"].to_numpy(),
+                "units": units,
+                "revenue": units * self.price,
+            })
+        return self._cache.get_or_compute(("products", bounds), compute)
+
+    # Top-k sản phẩm theo metric ("units" hoặc "revenue") trong kỳ period = (start, end)
+    # category = (cột phân loại, nhãn) để chỉ xếp hạng trong một nhóm
+    # Chọn bằng heap (heapq.nlargest, O(n log k)); kết quả được cache theo (metric, kỳ, nhóm)
+    # và giữ k lớn nhất đã tính, nên top-1, top-5, top-10 của cùng kỳ dùng chung một lần xếp hạng
+    @instrument("top_k")
+    def top_k(self, metric, k, period=None, category=None):
+        start, end = period if period is not None else (None, None)
+        key = ("top", metric, self._bounds(start, end), category)
+        cached = self._cache.get(key)
+        if cached is None or cached[0] < k:
+            totals = self.product_totals(start, end)
+            values = totals[metric].to_numpy()
+            if category is None:
+                positions = range(len(values))
+            else:
+                dimension, label = category
+                positions = np.flatnonzero(self.products[dimension].to_numpy() == label)
+            chosen = heapq.nlargest(k, positions, key=values.__getitem__)
+            cached = (k, totals.iloc[chosen].reset_index(drop=True))
+            self._cache.put(key, cached)
+        return cached[1].head(k)
+
+    # Số lượng bán và doanh thu theo từng nhóm của một cột phân loại
+    def category_totals(self, dimension, start=None, end=None):
+        labels, units_cum, revenue_cum, units_total, revenue_total = self.categories[dimension]
+        bounds = self._bounds(start, end)
+
+        def compute():
+            if bounds is None:
+                units, revenue = units_total, revenue_total
+            else:
+                lo, hi = bounds
+                units = units_cum[:, hi] - units_cum[:, lo]
+                revenue = revenue_cum[:, hi] - revenue_cum[:, lo]
+            return pd.DataFrame({"units": units, "revenue": revenue}, index=labels)
+        return self._cache.get_or_compute(("category", dimension, bounds), compute)
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import traceback
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from categories import category_counts
+from data_loader import file_signature, load_query_store
+from registry import DATA_SOURCE, load_registry
+from slow_sellers import SLOW_SELLER_DIMENSIONS, find_slow_sellers
+from views import CATEGORY_CHART_TITLES, kpi_summary
+
+# File dữ liệu mặc định khi không dùng danh mục nhiều file (COFFEE_DATA_SOURCE)
+DEFAULT_SOURCE = "kf_coffee (1).xlsx"
+
+# Số kết quả truy vấn (JSON đã mã hóa) giữ lại trong bộ nhớ
+API_CACHE_SIZE = 256
+
+# Số sản phẩm tối đa của một truy vấn top-k
+MAX_K = 100
+
+# Giới hạn kích thước dòng yêu cầu và header
+MAX_HEADER_BYTES = 16 * 1024
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+# Lỗi tham số truy vấn, trả về 400 kèm thông báo
+class QueryError(ValueError):
+    pass
+
+
+# Hàm đọc tham số ngày (YYYY-MM-DD), None nếu không truyền
+def _date(params, name):
+    value = params.get(name, [None])[0]
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value).normalize()
+    except ValueError:
+        raise QueryError(f"Ngày không hợp lệ: {name}={value}")
+
+
+# Hàm đọc khoảng ngày (start, end); báo lỗi khi start sau end
+def _period(params):
+    start, end = _date(params, "start"), _date(params, "end")
+    if start is not None and end is not None and start > end:
+        raise QueryError(f"start ({start:%Y-%m-%d}) phải không sau end ({end:%Y-%m-%d})")
+    return start, end
+
+
+def _int(params, name, default, low=1, high=MAX_K):
+    value = params.get(name, [default])[0]
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"Số không hợp lệ: {name}={value}")
+    if not low <= value <= high:
+        raise QueryError(f"{name} phải nằm trong [{low}, {high}]")
+    return value
+
+
+def _choice(params, name, default, choices):
+    value = params.get(name, [default])[0]
+    if value not in choices:
+        raise QueryError(f"{name} phải là một trong: {', '.join(map(str, choices))}")
+    return value
+
+
+# Hàm đổi bảng kết quả thành danh sách bản ghi JSON
+def _records(frame):
+    return json.loads(frame.to_json(orient="records", force_ascii=False))
+
+
+# Các endpoint: mỗi hàm nhận (store, params) và trả về dữ liệu JSON
+def kpi_endpoint(store, params):
+    start, end = _period(params)
+    start = store.first_date if start is None else start
+    end = store.last_date if end is None else end
+    if start > end:
+        raise QueryError(f"Khoảng ngày rỗng: {start:%Y-%m-%d} → {end:%Y-%m-%d}")
+    kpi = kpi_summary(store, start, end, _int(params, "k", 10))
+    kpi["top_products"] = _records(kpi["top_products"])
+    return {"start": f"{start:%Y-%m-%d}", "end": f"{end:%Y-%m-%d}", **kpi}
+
+
+def top_endpoint(store, params):
+    metric = _choice(params, "metric", "units", ["units", "revenue"])
+    period = _period(params)
+    category = None
+    if "dimension" in params:
+        dimension = _choice(params, "dimension", None, list(CATEGORY_CHART_TITLES))
+        label = params.get("label", [""])[0]
+        labels = store.products[dimension].astype(str).unique()
+        if label not in labels:
+            raise QueryError(f"label phải là một trong: {', '.join(labels)}")
+        category = (dimension, label)
+    top = store.top_k(metric, _int(params, "k", 10), None if period == (None, None) else period, category)
+    return {"metric": metric, "products": _records(top)}
+
+
+def slow_sellers_endpoint(store, params):
+    # dimension=all: tính phân vị trên toàn bộ sản phẩm
+    dimension = _choice(params, "dimension", "coffee_type", [d or "all" for d in SLOW_SELLER_DIMENSIONS])
+    dimension = None if dimension == "all" else dimension
+    data = find_slow_sellers(store, *_period(params), k=_int(params, "k", 10),
+                             dimension=dimension, percentile=_int(params, "percentile", 25, 0, 100))
+    return {"dimension": dimension, "products": _records(data)}
+
+
+def categories_endpoint(store, params):
+    dimension = _choice(params, "dimension", "packaging", list(CATEGORY_CHART_TITLES))
+    counts = category_counts(store.products, dimension)
+    totals = store.category_totals(dimension, *_period(params))
+    table = totals.reindex(counts.index, fill_value=0.0)
+    table.insert(0, "products", counts)
+    return {"dimension": dimension, "title": CATEGORY_CHART_TITLES[dimension],
+            "categories": _records(table.rename_axis("label").reset_index())}
+
+
+ENDPOINTS = {
+    "/kpi": kpi_endpoint,
+    "/top": top_endpoint,
+    "/slow-sellers": slow_sellers_endpoint,
+    "/categories": categories_endpoint,
+}
+
+
+# Dịch vụ số liệu: chọn kho tổng hợp theo nguồn, cache kết quả theo (phiên bản dữ liệu, truy vấn)
+# ETag là băm của phiên bản dữ liệu và truy vấn, nên yêu cầu có If-None-Match trùng được trả 304
+# mà không cần đọc kho hay tính lại. ETag của nội dung mới tính là băm theo phiên bản của kho
+# thực sự được dùng (có thể là bản cũ khi file đang được đọc lại), không theo phiên bản hiện tại
+class MetricsService:
+    def __init__(self, source=None):
+        self.source = source
+        self.registry = load_registry() if source is None and DATA_SOURCE else None
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Phiên bản dữ liệu của truy vấn (đổi khi file nguồn thay đổi)
+    def version(self, params):
+        if self.registry is not None:
+            self.registry.refresh()
+            return self.registry.version(params.get("store"), params.get("month"))
+        return file_signature(self.source or DEFAULT_SOURCE)
+
+    # Kho truy vấn kèm phiên bản của bản dữ liệu đã dựng ra kho
+    def store(self, params):
+        if self.registry is not None:
+            return self.registry.load_aggregate_store(params.get("store"), params.get("month"), with_version=True)
+        return load_query_store(self.source or DEFAULT_SOURCE, with_version=True)
+
+    # Hàm trả lời một truy vấn: (etag, nội dung JSON); nội dung None nếu client đã có bản mới nhất
+    def query(self, path, params, if_none_match=None):
+        canonical = "&".join(f"{name}={value}" for name in sorted(params) for value in params[name])
+        etag = _etag(self.version(params), path, canonical)
+        if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return etag, None
+        with self._lock:
+            if etag in self._results:
+                self._results.move_to_end(etag)
+                return etag, self._results[etag]
+        store, version = self.store(params)
+        etag = _etag(version, path, canonical)
+        body = json.dumps(ENDPOINTS[path](store, params), ensure_ascii=False,
+                          default=_json_default).encode("utf-8")
+        with self._lock:
+            self._results[etag] = body
+            while len(self._results) > API_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return etag, body
+
+
+def _etag(version, path, canonical):
+    return '"' + hashlib.sha1(f"{version}|{path}?{canonical}".encode()).hexdigest() + '"'
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return f"{value:%Y-%m-%d}"
+    raise TypeError(f"Không mã hóa được {type(value).__name__}")
+
+
+def _response(status, headers=(), body=b"", head=False):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}", *headers]
+    if status != 304:
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (b"" if head or status == 304 else body)
+
+
+def _error(status, message):
+    body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+    return _response(status, ["Content-Type: application/json; charset=utf-8"], body)
+
+
+# Hàm xử lý một kết nối: đọc lần lượt các yêu cầu (giữ kết nối với HTTP/1.1)
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            try:
+                request_line, *header_lines = head.decode("utf-8").split("\r\n")
+            except UnicodeDecodeError:
+                writer.write(_error(400, "Yêu cầu không phải UTF-8"))
+                break
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            try:
+                method, target, version = request_line.split(" ")
+            except ValueError:
+                writer.write(_error(400, "Dòng yêu cầu không hợp lệ"))
+                break
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+            # Bỏ qua thân yêu cầu (nếu có) để đọc được yêu cầu tiếp theo
+            if headers.get("content-length", "0").isdigit() and int(headers.get("content-length", "0")):
+                await reader.readexactly(int(headers["content-length"]))
+
+            writer.write(await _dispatch(service, method, target, headers))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def _dispatch(service, method, target, headers):
+    if method not in ("GET", "HEAD"):
+        return _error(405, "Chỉ hỗ trợ GET và HEAD")
+    url = urlsplit(target)
+    if url.path == "/health":
+        return _response(200, ["Content-Type: application/json"], b'{"status": "ok"}', method == "HEAD")
+    if url.path not in ENDPOINTS:
+        return _error(404, f"Không có endpoint {url.path}; có: {', '.join(ENDPOINTS)}")
+    params = parse_qs(url.query)
+    try:
+        # Tính toán chạy trên luồng riêng để vòng lặp sự kiện vẫn nhận kết nối khác
+        etag, body = await asyncio.to_thread(service.query, url.path, params, headers.get("if-none-match"))
+    except QueryError as e:
+        return _error(400, str(e))
+    except Exception:
+        # Chi tiết lỗi chỉ ghi ở máy chủ, không gửi cho client
+        traceback.print_exc()
+        return _error(500, "Lỗi khi tính số liệu")
+    cache_headers = [f"ETag: {etag}", "Cache-Control: no-cache"]
+    if body is None:
+        return _response(304, cache_headers)
+    return _response(200, ["Content-Type: application/json; charset=utf-8", *cache_headers], body,
+                     method == "HEAD")
+
+
+async def serve(host, port, source=None):
+    service = MetricsService(source)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES)
+    print(f"API số liệu đang chạy tại http://{host}:{port} ({', '.join(ENDPOINTS)})")
+    async with server:
+        await server.serve_forever()
+
+
+# Chạy API số liệu cục bộ, ví dụ:
+#   python api.py --port 8600
+#   curl "http://127.0.0.1:8600/kpi?start=2025-03-07&end=2025-03-13"
+#   curl "http://127.0.0.1:8600/top?metric=revenue&k=5&dimension=coffee_type&label=Sữa"
+#   curl "http://127.0.0.1:8600/slow-sellers?k=10"   /   "http://127.0.0.1:8600/categories?dimension=packaging"
+# Khi đặt COFFEE_DATA_SOURCE, có thể lọc theo ?store=...&month=YYYY-MM (lặp lại được)
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP cho các số liệu KPI của dashboard")
+    parser.add_argument("source", nargs="?", help=f"File dữ liệu (mặc định {DEFAULT_SOURCE} hoặc COFFEE_DATA_SOURCE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.source))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,37 @@
 import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
-import pandas as pd
-import json
-from datetime import datetime
+from data_loader import load_uploaded_aggregate_store
+from aggregates import make_periods
+from slow_sellers import SLOW_SELLER_DIMENSIONS, find_slow_sellers
+from diagnostics import begin_app, end_app, stage
 
 # --- Setup Streamlit page
 st.set_page_config(page_title="Phân tích sản phẩm bán chậm", layout="wide")
 
-# --- List of 10 slow-selling products
-slow_selling_products = [
-    "Cà phê sữa The Coffee House 180ml (1 lon)",
-    "Cà phê sữa đá hòa tan The Coffee House bịch 25 gói x 22g",
-    "Cà phê sữa đá miền Nam Cà Phê Phố túi 30 gói x 24g",
-    "Cà phê sữa nhà làm Cà Phê Phố túi 30 gói x 28g",
-    "Cà phê rang xay culi Highlands Coffee gói 200g",
-    "Cà phê hoà tan nguyên chất 114 UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-    "Cà phê hoà tan nguyên chất Sumiyaki UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-    "Cà phê hoà tan nguyên chất 117 UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-    "Cà phê hoà tan black 2IN1 K-Coffee hộp 15 gói x 17g (1 Hộp)",
-    "Cà phê hoà tan pha lạnh 3in1 vị nguyên bản UCC hộp 250g (10 gói x 25g) (1 Hộp)"
-]
+# --- Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("bancham_app")
 
 # --- Load CSV file
 uploaded_file = st.file_uploader("📂 Tải lên file CSV", type=["xlsx"])
 if uploaded_file:
-    df = pd.read_CSV(uploaded_file, sheet_name="Trang tính1")
-    df = df[df["name"].isin(slow_selling_products)].copy()
+    # --- Đọc, ingest và dựng kho tổng hợp, cache theo nội dung file
+    store = load_uploaded_aggregate_store(uploaded_file)
 
-    # --- Helper functions
-    def parse_date(date_str):
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d")
-        except:
-            return None
+    # --- Các kỳ phân tích: từng tuần và cả khoảng dữ liệu
+    periods = make_periods(store.first_date, store.last_date, "weekly")
+    periods.append(("Cả khoảng dữ liệu", store.first_date, store.last_date))
+    period_bounds = {name: (start, end) for name, start, end in periods}
 
-    def sum_stock_decreased_in_range(stock_history_str, start_date, end_date):
-        try:
-            history = json.loads(stock_history_str).get("stock_history", [])
-            start = parse_date(start_date)
-            end = parse_date(end_date)
-            total = 0
-            for entry in history:
-                entry_date = parse_date(entry.get("date"))
-                if entry_date and start <= entry_date <= end:
-                    total += float(entry.get("stock_decreased", 0))
-            return total
-        except:
-            return 0
+    # --- Dropdown lựa chọn kỳ, cách nhóm và ngưỡng phân vị
+    period = st.selectbox("📊 Chọn kỳ phân tích", list(period_bounds))
+    dimension = st.selectbox("🏷️ Xếp hạng trong nhóm", options=list(SLOW_SELLER_DIMENSIONS),
+                             format_func=lambda x: SLOW_SELLER_DIMENSIONS[x])
+    percentile = st.slider("📉 Ngưỡng phân vị (%)", min_value=5, max_value=100, value=25, step=5)
 
-    # --- Tính số lượng theo tuần
-    df["Tuần 1"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-14"))
-    df["Tuần 2"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-15", "2025-03-22"))
-    df["Tuần 3"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-23", "2025-03-28"))
-    df["Cả tháng"] = df["Tuần 1"] + df["Tuần 2"] + df["Tuần 3"]
-
-    # --- Dropdown lựa chọn kỳ
-    period = st.selectbox("📊 Chọn kỳ phân tích", ["Tuần 1", "Tuần 2", "Tuần 3", "Cả tháng"])
-
-    # --- Lọc dữ liệu
-    threshold = 25
-    if period in ["Tuần 1", "Tuần 2", "Tuần 3"]:
-        data_filtered = df[(df[period] > 0) & (df[period] < threshold)][["name", period]].sort_values(by=period, ascending=False)
-    else:
-        mask = (
-            ((df["Tuần 1"] > 0) & (df["Tuần 1"] < threshold)) |
-            ((df["Tuần 2"] > 0) & (df["Tuần 2"] < threshold)) |
-            ((df["Tuần 3"] > 0) & (df["Tuần 3"] < threshold))
-        )
-        df_filtered = df[mask].copy()
-        df_filtered["Cả tháng"] = df_filtered["Tuần 1"] + df_filtered["Tuần 2"] + df_filtered["Tuần 3"]
-        data_filtered = df_filtered[["name", "Cả tháng"]].sort_values(by="Cả tháng", ascending=False)
+    # --- Tìm 10 sản phẩm chậm nhất theo tốc độ bán trong kỳ
+    data_filtered = find_slow_sellers(store, *period_bounds[period], k=10,
+                                      dimension=dimension, percentile=percentile)
 
     # --- Hiển thị kết quả
     if data_filtered.empty:
@@ -78,15 +39,18 @@ if uploaded_file:
     else:
         st.subheader(f"📌 Biểu đồ sản phẩm bán chậm - {period}")
         fig, ax = plt.subplots(figsize=(12, 6))
-        sns.barplot(data=data_filtered, x=period, y="name", palette="Set2", ax=ax)
+        sns.barplot(data=data_filtered, x="units", y="name", palette="Set2", ax=ax)
 
-        for i, v in enumerate(data_filtered[period]):
+        for i, v in enumerate(data_filtered["units"]):
             ax.text(v + 0.2, i, str(int(v)), va='center', color='black', fontweight='bold')
 
         ax.set_xlabel("Số lượng bán")
         ax.set_ylabel("Tên sản phẩm")
         ax.grid(axis="x", linestyle="--", alpha=0.5)
-        st.pyplot(fig)
+        with stage("render"):
+            st.pyplot(fig)
+
+        st.info(f"🧾 Tổng số lượng bán trong kỳ: **{int(data_filtered['units'].sum())}** sản phẩm.")
 
-        st.info(f"🧾 Tổng số lượng bán trong kỳ: **{int(data_filtered[period].sum())}** sản phẩm.")
 
+end_app()
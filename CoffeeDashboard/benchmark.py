@@ -0,0 +1,170 @@
+import argparse
+import gc
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateStore
+from charts import bar_figure
+from data_loader import read_source
+from figure_cache import render_png
+from ingest import ingest
+from slow_sellers import find_slow_sellers
+
+# Kích thước mặc định: số sản phẩm × số ngày lịch sử
+DEFAULT_SIZES = ["50x22", "1000x30", "10000x90"]
+
+# Ngày đầu tiên của dữ liệu giả
+START_DATE = pd.Timestamp("2025-03-07")
+
+# Mẫu tên để bộ phân loại bao bì / loại cà phê có đủ nhóm
+NAME_TEMPLATES = [
+    "Cà phê sữa đá hoà tan Thương hiệu {i} hộp 10 gói x 22g",
+    "Cà phê rang xay truyền thống Thương hiệu {i} túi 500g",
+    "Cà phê sữa Thương hiệu {i} lon 180ml (1 Lon)",
+    "Cà phê 3in1 Thương hiệu {i} bịch 50 gói",
+    "Cà phê đen Thương hiệu {i} ly 250ml",
+]
+
+
+# Hàm tạo dữ liệu giả cùng dạng kf_coffee.csv: n_products dòng, mỗi dòng n_days mục lịch sử
+# (chuỗi JSON {"stock_history": [...]}, giá trị dạng chuỗi "28.0" như file xuất thật)
+def make_synthetic(n_products, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = [f"{d:%Y-%m-%d}" for d in pd.date_range(START_DATE, periods=n_days)]
+    increased = rng.integers(0, 50, size=(n_products, n_days))
+    decreased = rng.poisson(rng.gamma(1.5, 6.0, size=(n_products, 1)), size=(n_products, n_days))
+    histories = [
+        json.dumps({"stock_history": [
+            {"date": date, "stock_increased": f"{inc:.1f}", "stock_decreased": f"{dec:.1f}"}
+            for date, inc, dec in zip(dates, inc_row.tolist(), dec_row.tolist())
+        ]}, indent=2)
+        for inc_row, dec_row in zip(increased, decreased)
+    ]
+    return pd.DataFrame({
+        "": np.nan,
+        "name": [NAME_TEMPLATES[i % len(NAME_TEMPLATES)].format(i=i) for i in range(n_products)],
+        "stock_quantity": rng.integers(0, 1000, size=n_products).astype(np.float64),
+        "total_sold": rng.integers(0, 100000, size=n_products),
+        "price": rng.integers(10, 500, size=n_products) * 1000.0,
+        "stock_history": histories,
+    })
+
+
+# Hàm đo một bước: thời gian (giây) và bộ nhớ cấp phát đỉnh (MB, khi bật tracemalloc)
+def measure(stage, func, memory):
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, {"stage": stage, "seconds": seconds, "peak_mb": peak_mb}
+
+
+# Hàm vẽ biểu đồ top 10 bằng matplotlib thành ảnh PNG (không dùng lại ảnh đã cache)
+def render_matplotlib(top_products, key):
+    def draw():
+        fig, ax = plt.subplots(figsize=(12, 6))
+        ax.barh(top_products["name"], top_products["units"], color="#4CAF50")
+        for i, v in enumerate(top_products["units"]):
+            ax.text(v + 5, i, str(int(v)), va='center', fontweight='bold')
+        return fig
+    return render_png(("benchmark", key, time.perf_counter_ns()), draw)
+
+
+# Hàm chạy toàn bộ pipeline cho một kích thước, trả về kết quả từng bước
+def run_size(n_products, n_days, workdir, memory=False):
+    path = os.path.join(workdir, f"synthetic_{n_products}x{n_days}.csv")
+    make_synthetic(n_products, n_days).to_csv(path, index=False)
+    size_mb = os.path.getsize(path) / 1e6
+    week = (START_DATE, START_DATE + pd.Timedelta(days=6))
+
+    results = []
+    df, row = measure("load", lambda: read_source(path), memory)
+    results.append(row)
+    (products, movements), row = measure("parse", lambda: ingest(df), memory)
+    results.append(row)
+    del df
+    store, row = measure("aggregate", lambda: AggregateStore(products, movements), memory)
+    results.append(row)
+
+    def rank():
+        store.product_totals(*week)
+        return (store.top_k("units", 10), store.top_k("revenue", 5, week),
+                find_slow_sellers(store, *week, k=10))
+    (top_units, _, _), row = measure("rank", rank, memory)
+    results.append(row)
+
+    _, row = measure("render_plotly", lambda: bar_figure(
+        top_units["name"], top_units["units"], horizontal=True).to_json(), memory)
+    results.append(row)
+    _, row = measure("render_matplotlib", lambda: render_matplotlib(top_units, path), memory)
+    results.append(row)
+
+    entries = n_products * n_days
+    for row in results:
+        row.update({
+            "products": n_products,
+            "days": n_days,
+            "file_mb": round(size_mb, 2),
+            "entries_per_second": entries / row["seconds"] if row["seconds"] > 0 else None,
+        })
+    return results
+
+
+# Hàm lấy mã commit hiện tại để ghi kèm kết quả (None nếu không phải repo git)
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Đo hiệu năng pipeline trên dữ liệu giả:
+#   python benchmark.py --sizes 1000x30 10000x90 --memory --output benchmark.jsonl
+# --output ghi thêm mỗi bước thành một dòng JSON (kèm thời điểm và commit) để theo dõi theo thời gian
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian và bộ nhớ từng bước của pipeline")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="Các kích thước dạng <số sản phẩm>x<số ngày>")
+    parser.add_argument("--memory", action="store_true",
+                        help="Đo bộ nhớ đỉnh bằng tracemalloc (làm chậm các bước)")
+    parser.add_argument("--output", help="File JSON Lines để ghi thêm kết quả")
+    args = parser.parse_args()
+
+    run = {"timestamp": pd.Timestamp.now().isoformat(timespec="seconds"), "commit": git_commit()}
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # Chạy thử một lần cho nhỏ để việc nạp font, module plotly... không bị tính vào bước đầu tiên
+        run_size(10, 7, workdir)
+        for size in args.sizes:
+            n_products, n_days = (int(x) for x in size.lower().split("x"))
+            rows.extend(run_size(n_products, n_days, workdir, args.memory))
+
+    table = pd.DataFrame(rows)
+    print(table[["products", "days", "file_mb", "stage", "seconds", "entries_per_second", "peak_mb"]]
+          .to_string(index=False, float_format=lambda x: f"{x:,.3f}"))
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({**run, **row}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
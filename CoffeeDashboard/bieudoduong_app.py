@@ -1,38 +1,31 @@
 import streamlit as st
 import pandas as pd
-import json
 import matplotlib.pyplot as plt
 import seaborn as sns
+from data_loader import load_aggregate_store
+from diagnostics import begin_app, end_app, stage
 
 # Cấu hình trang Streamlit
 st.set_page_config(layout="wide", page_title="Dashboard Doanh Thu", page_icon="📈")
 st.title("📊 Biểu Đồ Doanh Thu Top 5 Sản Phẩm")
 
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("bieudoduong_app")
+
 # Đọc dữ liệu từ file
-@st.cache_data  # Cache để tăng hiệu suất
+# load_aggregate_store đã cache theo file và tự dựng lại khi file thay đổi
 def load_data():
     try:
-        df = pd.read_csv("kf_coffee.csv")
-        return df
+        return load_aggregate_store("kf_coffee.csv")
     except Exception as e:
         st.error(f"Không thể đọc file dữ liệu: {e}")
         return None
 
-df = load_data()
-
-if df is not None:
-    # Hàm tính tổng số lượng bán từ stock_history
-    def total_sold_from_history(stock_history_str):
-        try:
-            history = json.loads(stock_history_str).get("stock_history", [])
-            return sum(float(entry.get("stock_decreased", 0)) for entry in history)
-        except:
-            return 0
+store = load_data()
 
-    # Tính toán dữ liệu
-    df['so_luong_ban'] = df['stock_history'].apply(total_sold_from_history)
-    df['doanh_thu'] = df['so_luong_ban'] * df['price']
-    revenue_by_product = df.groupby('name')['doanh_thu'].sum().sort_values(ascending=False).head(5)
+if store is not None:
+    # Top 5 theo doanh thu toàn thời gian, chọn bằng heap trên kho tổng hợp
+    revenue_by_product = store.top_k("revenue", 5).set_index('name')['revenue']
 
     # Tạo container cho biểu đồ
     with st.container():
@@ -98,19 +91,22 @@ if df is not None:
         ax.xaxis.grid(False)
 
         # Hiển thị biểu đồ trong Streamlit
-        st.pyplot(fig)
+        with stage("render"):
+            st.pyplot(fig)
 
     # Hiển thị bảng dữ liệu
     with st.expander("📊 Xem dữ liệu chi tiết"):
         st.dataframe(
-            revenue_by_product.reset_index().rename(columns={'name': 'Sản phẩm', 'doanh_thu': 'Doanh thu (VNĐ)'}),
+            revenue_by_product.reset_index().rename(columns={'name': 'Sản phẩm', 'revenue': 'Doanh thu (VNĐ)'}),
             column_config={
                 "Doanh thu (VNĐ)": st.column_config.NumberColumn(format="%,d")
             },
-            use_container_width=True
+            width="stretch"
         )
 
     # Thêm thông tin phụ
     st.caption("💡 Dữ liệu được cập nhật lần cuối: " + pd.Timestamp.now().strftime("%d/%m/%Y %H:%M"))
 else:
-    st.warning("Vui lòng tải lên file dữ liệu hợp lệ để hiển thị biểu đồ")
\ No newline at end of file
+    st.warning("Vui lòng tải lên file dữ liệu hợp lệ để hiển thị biểu đồ")
+
+end_app()
\ No newline at end of file
@@ -1,15 +1,22 @@
 import streamlit as st
 import plotly.graph_objects as go
+from data_loader import load_aggregate_store
+from categories import CATEGORY_COLORS, category_counts
+from diagnostics import begin_app, end_app, stage
+
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("bieudotron_app")
+
+# Đọc kho tổng hợp (bảng sản phẩm đã phân loại lúc ingest, cache dùng chung)
+products = load_aggregate_store("kf_coffee.csv").products
 
 # Dữ liệu loại bao bì
-packaging_types = ['Lon', 'Hộp', 'Túi', 'Gói', 'Bịch', 'Ly']
-packaging_counts = [3, 23, 6, 13, 4, 1]
-packaging_colors = ['#FF6F61', '#6B5B95', '#88B04B', '#F7CAC9', '#92A8D1', '#F4E04D']
+packaging_counts = category_counts(products, "packaging")
+packaging_colors = [CATEGORY_COLORS[t] for t in packaging_counts.index]
 
 # Dữ liệu loại cà phê
-coffee_types = ['Hòa tan', 'Rang xay', 'Sữa']
-coffee_counts = [19, 7, 24]
-coffee_colors = ['#FF6F61', '#6B5B95', '#88B04B']
+coffee_counts = category_counts(products, "coffee_type")
+coffee_colors = [CATEGORY_COLORS[t] for t in coffee_counts.index]
 
 # Tạo dropdown trên sidebar hoặc main page
 selected_option = st.selectbox(
@@ -19,13 +26,13 @@ selected_option = st.selectbox(
 
 # Xử lý dữ liệu theo lựa chọn
 if selected_option == 'Phân phối sản phẩm theo loại bao bì':
-    labels = packaging_types
-    values = packaging_counts
+    labels = list(packaging_counts.index)
+    values = packaging_counts.tolist()
     colors = packaging_colors
     title = 'Phân phối sản phẩm theo loại bao bì'
 else:
-    labels = coffee_types
-    values = coffee_counts
+    labels = list(coffee_counts.index)
+    values = coffee_counts.tolist()
     colors = coffee_colors
     title = 'Phân phối sản phẩm theo loại cà phê'
 
@@ -50,4 +57,7 @@ fig.update_layout(
 )
 
 # Hiển thị biểu đồ trong Streamlit
-st.plotly_chart(fig)
+with stage("render"):
+    st.plotly_chart(fig)
+
+end_app()
@@ -0,0 +1,71 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Nhóm cho sản phẩm không khớp từ khóa nào
+OTHER = "Khác"
+
+# Loại bao bì và màu tương ứng trên biểu đồ tròn
+PACKAGING_TYPES = ['Lon', 'Hộp', 'Túi', 'Gói', 'Bịch', 'Ly']
+PACKAGING_COLORS = ['#FF6F61', '#6B5B95', '#88B04B', '#F7CAC9', '#92A8D1', '#F4E04D']
+
+# Loại cà phê, theo thứ tự ưu tiên khi tên khớp nhiều loại
+COFFEE_TYPES = ['Rang xay', 'Sữa', 'Hòa tan']
+COFFEE_COLORS = ['#6B5B95', '#88B04B', '#FF6F61']
+OTHER_COLOR = '#B0BEC5'
+
+# Màu theo nhãn nhóm (tên loại bao bì và loại cà phê không trùng nhau)
+CATEGORY_COLORS = {**dict(zip(PACKAGING_TYPES, PACKAGING_COLORS)),
+                   **dict(zip(COFFEE_TYPES, COFFEE_COLORS)),
+                   OTHER: OTHER_COLOR}
+
+# Đơn vị ghi rõ trong ngoặc, ví dụ "(1 Hộp)", được ưu tiên hơn từ khóa trong tên
+PACKAGING_UNIT_PATTERN = re.compile(r"\(\s*\d+\s*(lon|hộp|túi|gói|bịch|ly)\s*\)")
+# Ngược lại lấy từ khóa bao bì xuất hiện đầu tiên ("hộp 10 gói" là Hộp)
+PACKAGING_WORD_PATTERN = re.compile(r"\b(lon|hộp|túi|gói|bịch|ly)\b")
+
+COFFEE_PATTERNS = {
+    'Rang xay': re.compile(r"rang\s+xay"),
+    'Sữa': re.compile(r"\bsữa\b"),
+    # Tên dùng cả hai cách bỏ dấu "hòa"/"hoà"; 3in1, 2in1, "3 trong 1" cũng là cà phê hòa tan
+    'Hòa tan': re.compile(r"h(?:òa|oà)\s+tan|\b\d\s*in\s*1\b|\b\d\s+trong\s+1\b"),
+}
+
+
+# Hàm chuẩn hóa tên để so khớp: dựng sẵn dấu (NFC) và chữ thường
+def normalize_names(names):
+    return pd.Series(names, dtype="string").fillna("").str.normalize("NFC").str.lower()
+
+
+# Hàm phân loại bao bì cho cả cột tên bằng thao tác chuỗi vector của pandas
+def classify_packaging(names):
+    normalized = normalize_names(names)
+    unit = normalized.str.extract(PACKAGING_UNIT_PATTERN, expand=False)
+    word = normalized.str.extract(PACKAGING_WORD_PATTERN, expand=False)
+    keyword = unit.fillna(word)
+    labels = {t.lower(): t for t in PACKAGING_TYPES}
+    packaging = keyword.map(labels).fillna(OTHER)
+    return pd.Categorical(packaging, categories=PACKAGING_TYPES + [OTHER])
+
+
+# Hàm phân loại cà phê: mỗi sản phẩm thuộc đúng một loại theo thứ tự ưu tiên
+def classify_coffee_type(names):
+    normalized = normalize_names(names)
+    masks = [normalized.str.contains(pattern).to_numpy(dtype=bool) for pattern in COFFEE_PATTERNS.values()]
+    coffee_type = np.select(masks, list(COFFEE_PATTERNS), default=OTHER)
+    return pd.Categorical(coffee_type, categories=COFFEE_TYPES + [OTHER])
+
+
+# Hàm thêm cột packaging và coffee_type vào bảng sản phẩm
+def classify_products(products):
+    if "name" in products:
+        products["packaging"] = classify_packaging(products["name"])
+        products["coffee_type"] = classify_coffee_type(products["name"])
+    return products
+
+
+# Hàm đếm số sản phẩm theo từng nhóm; nhóm "Khác" chỉ hiện khi có sản phẩm
+def category_counts(products, column):
+    counts = products[column].value_counts(sort=False)
+    return counts[(counts > 0) | (counts.index != OTHER)]
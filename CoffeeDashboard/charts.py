@@ -0,0 +1,84 @@
+import plotly.graph_objects as go
+from plotly.colors import qualitative, sample_colorscale
+
+from diagnostics import instrument
+
+# Các kiểu vẽ biểu đồ cột/đường
+# plotly: gửi dữ liệu cho trình duyệt vẽ (kéo/phóng to được), máy chủ không phải render ảnh
+# matplotlib: vẽ ảnh PNG trên máy chủ như trước
+CHART_BACKENDS = {
+    "plotly": "Plotly (vẽ ở trình duyệt)",
+    "matplotlib": "Matplotlib (ảnh tĩnh)",
+}
+
+# Từ số điểm này trở lên biểu đồ đường dùng WebGL (Scattergl)
+WEBGL_MIN_POINTS = 1000
+
+# Bảng màu Set2 (giống seaborn) cho biểu đồ sản phẩm bán chậm
+SET2_COLORS = qualitative.Set2
+
+# Quá số cột này thì bỏ nhãn số trên từng cột (chỉ còn hiện khi rê chuột)
+BAR_LABEL_MAX = 50
+
+
+# Hàm tạo bảng màu: chuỗi màu cố định (một màu hoặc lặp lại danh sách) hoặc thang màu liên tục
+def bar_colors(n, color=None, palette=None, colorscale=None):
+    if colorscale is not None:
+        return sample_colorscale(colorscale, [i / max(n - 1, 1) for i in range(n)])
+    if palette is not None:
+        return [palette[i % len(palette)] for i in range(n)]
+    return color
+
+
+# Hàm vẽ biểu đồ cột bằng Plotly; horizontal=True thì cột nằm ngang, phần tử đầu ở trên cùng
+@instrument("plotly_bar")
+def bar_figure(labels, values, text=None, horizontal=False, color=None, palette=None,
+               colorscale=None, title=None, xlabel=None, ylabel=None, height=500):
+    labels = list(labels)
+    values = list(values)
+    show_text = text is not None and len(values) <= BAR_LABEL_MAX
+    bar = go.Bar(
+        x=values if horizontal else labels,
+        y=labels if horizontal else values,
+        orientation="h" if horizontal else "v",
+        marker=dict(color=bar_colors(len(values), color, palette, colorscale)),
+        text=list(text) if show_text else None,
+        textposition="outside" if show_text else "none",
+        hovertext=list(text) if text is not None else None,
+    )
+    fig = go.Figure(data=[bar])
+    fig.update_layout(title=title, xaxis_title=xlabel, yaxis_title=ylabel, height=height,
+                      dragmode="pan", margin=dict(t=60 if title else 30))
+    if horizontal:
+        fig.update_yaxes(autorange="reversed", automargin=True)
+    else:
+        fig.update_xaxes(tickangle=-45, automargin=True)
+    return fig
+
+
+# Hàm vẽ biểu đồ đường bằng Plotly, dùng WebGL khi nhiều điểm
+@instrument("plotly_line")
+def line_figure(labels, values, text=None, color="#2196F3", title=None, xlabel=None, ylabel=None,
+                height=600):
+    labels = list(labels)
+    values = list(values)
+    trace = go.Scattergl if len(values) >= WEBGL_MIN_POINTS else go.Scatter
+    show_text = text is not None and len(values) <= BAR_LABEL_MAX
+    line = trace(
+        x=labels,
+        y=values,
+        mode="lines+markers+text" if show_text else "lines+markers",
+        line=dict(color=color, width=3),
+        marker=dict(size=12, color=color, line=dict(color="black", width=1)),
+        text=list(text) if show_text else None,
+        textposition="top center",
+        textfont=dict(color="#4CAF50", size=14),
+        hovertext=list(text) if text is not None else None,
+    )
+    fig = go.Figure(data=[line])
+    fig.update_layout(title=title, xaxis_title=xlabel, yaxis_title=ylabel, height=height,
+                      dragmode="pan", plot_bgcolor="#F5F5F5")
+    fig.update_xaxes(tickangle=-45, automargin=True)
+    fig.update_yaxes(gridcolor="#E0E0E0", griddash="dash")
+    return fig
+
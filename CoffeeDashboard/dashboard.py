@@ -1,55 +1,39 @@
 import streamlit as st
-import pandas as pd
-import json
 import matplotlib.pyplot as plt
-from datetime import datetime
+from data_loader import load_dataset
+from aggregates import aggregate_periods
+from diagnostics import begin_app, end_app, stage
+from schema import movement_days
 
 # Tùy chỉnh layout
 st.set_page_config(layout="wide")
 st.title("📊 KPI Dashboard Doanh Số Cà Phê")
 
-# Đọc dữ liệu từ file Excel
-df = pd.read_excel("kf_coffee (1).xlsx", sheet_name="Trang tính1")
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("dashboard")
+
+# Đọc dữ liệu từ file Excel (đã ingest, cache dùng chung)
+df, movements = load_dataset("kf_coffee (1).xlsx")
 
 # Debugging: Inspect the data
 st.write("Sample data from kf_coffee (1).xlsx:")
 st.write(df.head())
 
-# Hàm parse date
-def parse_date(date_str):
-    try:
-        return datetime.strptime(date_str, "%Y-%m-%d")
-    except (ValueError, TypeError) as e:
-        st.write(f"Error parsing date: {date_str}, Error: {e}")
-        return None
-
-# Hàm tính số lượng bán trong khoảng ngày
-def sum_stock_decreased_in_range(stock_history_str, start_date, end_date):
-    try:
-        history = json.loads(stock_history_str).get("stock_history", [])
-        start = parse_date(start_date)
-        end = parse_date(end_date)
-        if not start or not end:
-            st.write(f"Invalid date range: {start_date} to {end_date}")
-            return 0
-        total = 0
-        for entry in history:
-            entry_date = parse_date(entry.get("date"))
-            if entry_date is None:
-                st.write(f"Skipping invalid date in entry: {entry}")
-                continue
-            if start <= entry_date <= end:
-                total += float(entry.get("stock_decreased", 0))
-        return total
-    except Exception as e:
-        st.write(f"Error processing stock_history: {stock_history_str}, Error: {e}")
-        return 0
-
-# Tính số lượng bán theo các giai đoạn
-df["Tuan_1"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-14"))
-df["Tuan_2"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-15", "2025-03-22"))
-df["Tuan_3"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-23", "2025-03-28"))
-df["Ca_thang"] = df["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-28"))
+# Debugging: các mục có ngày không hợp lệ
+invalid_dates = int((~movement_days(movements)[1]).sum())
+if invalid_dates:
+    st.write(f"Skipping {invalid_dates} entries with invalid date")
+
+# Các giai đoạn (tên kỳ, ngày bắt đầu, ngày kết thúc)
+periods = [
+    ("Tuan_1", "2025-03-07", "2025-03-14"),
+    ("Tuan_2", "2025-03-15", "2025-03-22"),
+    ("Tuan_3", "2025-03-23", "2025-03-28"),
+    ("Ca_thang", "2025-03-07", "2025-03-28"),
+]
+
+# Tính số lượng bán theo các giai đoạn trong một lần tổng hợp
+df[[name for name, _, _ in periods]] = aggregate_periods(df, movements, periods)
 
 # Tên các giai đoạn
 period_label = {
@@ -98,4 +82,7 @@ ax.bar(top_products["name"], top_products["doanh_thu"], color="#4CAF50")
 ax.set_title("Top 10 sản phẩm doanh thu cao", fontsize=14)
 ax.set_ylabel("Doanh thu (VNĐ)")
 ax.set_xticklabels(top_products["name"], rotation=45, ha='right')
-st.pyplot(fig)
\ No newline at end of file
+with stage("render"):
+    st.pyplot(fig)
+
+end_app()
\ No newline at end of file
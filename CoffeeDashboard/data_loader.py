@@ -0,0 +1,302 @@
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from aggregates import CATEGORY_COLUMNS, AggregateStore
+from diagnostics import instrument
+from forecast import fit_forecast
+from incremental import IncrementalStore
+from ingest import ingest, ingest_csv_chunked
+from inventory import InventoryLevels
+from schema import compact_dataset, compact_movements, compact_products
+from sql_store import SQLITE_SUFFIX, open_sql_store
+
+# Tên sheet dữ liệu trong file Excel
+EXCEL_SHEET = "Trang tính1"
+
+# File CSV lớn hơn ngưỡng này được ingest theo từng khối để giới hạn bộ nhớ
+STREAMING_THRESHOLD_BYTES = 64 * 1024 * 1024
+STREAMING_CHUNKSIZE = 10000
+
+# Chế độ tăng dần (COFFEE_INCREMENTAL=1): mỗi lần file nguồn đổi chỉ ingest các ngày mới của
+# từng sản phẩm, kho tổng hợp/tồn kho/dự báo dựng từ tổng tích lũy cộng dồn tại chỗ;
+# trạng thái lưu trong thư mục <nguồn>.incremental
+INCREMENTAL_MODE = os.environ.get("COFFEE_INCREMENTAL", "0") == "1"
+
+# Dạng dữ liệu gọn trong bộ nhớ: product_id int32, cột nhóm dạng Categorical, số lượng kiểu số hẹp,
+# ngày dạng số ngày int32 (xem schema.py); False để giữ dạng cũ (date datetime64, float64)
+COMPACT_SCHEMA = True
+
+# Bộ máy truy vấn: "dataframe" (mặc định, kho tổng hợp trong bộ nhớ) hoặc "sqlite"
+# (biến động kho nằm trong CSDL SQLite cạnh file nguồn, truy vấn bằng SQL)
+QUERY_ENGINE = os.environ.get("COFFEE_QUERY_ENGINE", "dataframe")
+
+# Hậu tố của các file cache Parquet đặt cạnh file nguồn
+PARQUET_SUFFIXES = {"products": ".products.parquet", "movements": ".movements.parquet"}
+
+# Bộ nhớ đệm dùng chung cho mọi app/tab trong cùng tiến trình:
+# khóa nguồn -> (chữ ký nguồn, {tên bảng dẫn xuất: giá trị})
+_cache = {}
+_lock = threading.RLock()
+# Khóa riêng của từng nguồn để nhiều nguồn có thể được ingest song song
+_source_locks = {}
+# Các khóa nguồn "upload:..." theo thứ tự dùng gần nhất; chỉ giữ UPLOAD_CACHE_SIZE file tải lên,
+# file dùng lâu nhất bị bỏ khỏi _cache và _source_locks
+UPLOAD_CACHE_SIZE = 8
+_uploads = OrderedDict()
+
+
+# Hàm tạo chữ ký của file: đổi mtime hoặc kích thước thì chữ ký đổi
+def file_signature(path):
+    stat = os.stat(path)
+    return hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+
+
+# Hàm đọc file nguồn (CSV hoặc Excel) thành DataFrame thô
+@instrument("load")
+def read_source(source, name=None):
+    name = name or str(source)
+    if name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(source, sheet_name=EXCEL_SHEET)
+    else:
+        df = pd.read_csv(source)
+    # Chuẩn hóa tên cột
+    df.columns = df.columns.str.strip().str.lower()
+    return df
+
+
+# Hàm trả về đường dẫn các file cache Parquet của một file nguồn
+def parquet_paths(path):
+    return {table: path + suffix for table, suffix in PARQUET_SUFFIXES.items()}
+
+
+# Hàm ghi bảng sản phẩm và bảng biến động ra Parquet cạnh file nguồn
+# Ghi ra file tạm rồi đổi tên để tiến trình khác không đọc phải file ghi dở
+def write_parquet_cache(path, products, movements):
+    for table, target in parquet_paths(path).items():
+        frame = products if table == "products" else movements
+        tmp = f"{target}.{os.getpid()}.tmp"
+        frame.to_parquet(tmp, index=False)
+        os.replace(tmp, target)
+
+
+# Hàm đọc cache Parquet (memory-map) nếu cache mới hơn file nguồn, ngược lại trả về None
+def read_parquet_cache(path):
+    paths = parquet_paths(path)
+    try:
+        source_mtime = os.stat(path).st_mtime_ns
+        if any(os.stat(p).st_mtime_ns < source_mtime for p in paths.values()):
+            return None
+        products = pd.read_parquet(paths["products"], memory_map=True)
+        movements = pd.read_parquet(paths["movements"], memory_map=True)
+        # Cache ghi từ phiên bản cũ (chưa có cột phân loại) thì bỏ qua
+        if "name" in products and not set(CATEGORY_COLUMNS) <= set(products.columns):
+            return None
+    except (OSError, ImportError, ValueError):
+        # Chưa có cache, thiếu pyarrow hoặc file cache hỏng: đọc từ file nguồn
+        return None
+    return products, movements
+
+
+# Kho tăng dần của từng file nguồn
+_stores = {}
+
+
+# Hàm lấy kho tăng dần của một file nguồn (đọc lại trạng thái đã lưu nếu có)
+# Biến động được lưu sẵn ở dạng trong bộ nhớ nên không phải đổi lại toàn bộ lịch sử mỗi lần làm mới
+def load_incremental_store(path):
+    key = os.path.abspath(path)
+    with _lock:
+        if key not in _stores:
+            _stores[key] = IncrementalStore(key + ".incremental", compact_movements if COMPACT_SCHEMA else None)
+        return _stores[key]
+
+
+# Hàm lấy kho tăng dần của file khi bật chế độ tăng dần, ngược lại None
+def _incremental(path):
+    return load_incremental_store(path) if INCREMENTAL_MODE else None
+
+
+# Hàm ingest tăng dần: chỉ phần lịch sử mới được giải mã và cộng dồn
+@instrument("parse_incremental")
+def ingest_incremental(path):
+    store = load_incremental_store(path)
+    store.update(read_source(path))
+    store.save()
+    return store.products, store.movements
+
+
+# Hàm đổi dữ liệu vừa ingest sang dạng lưu trong bộ nhớ
+def to_memory_layout(products, movements):
+    if COMPACT_SCHEMA:
+        return compact_dataset(products, movements)
+    return products, movements
+
+
+# Hàm ingest file nguồn, ưu tiên cache Parquet; đọc từ nguồn xong thì ghi cache
+@instrument("ingest_file")
+def ingest_file(path):
+    if INCREMENTAL_MODE:
+        products, movements = ingest_incremental(path)
+        return (compact_products(products) if COMPACT_SCHEMA else products), movements
+    cached = read_parquet_cache(path)
+    if cached is not None:
+        return to_memory_layout(*cached)
+    if path.lower().endswith(".csv") and os.stat(path).st_size > STREAMING_THRESHOLD_BYTES:
+        products, movements = ingest_csv_chunked(path, STREAMING_CHUNKSIZE, to_memory_layout)
+    else:
+        products, movements = to_memory_layout(*ingest(read_source(path)))
+    try:
+        write_parquet_cache(path, products, movements)
+    except (OSError, ImportError, ValueError):
+        # Thư mục chỉ đọc hoặc thiếu pyarrow: vẫn dùng dữ liệu vừa đọc
+        pass
+    return products, movements
+
+
+# Hàm lấy một bảng dẫn xuất từ cache; nếu chưa có hoặc nguồn đã đổi thì tính lại
+# build_dataset trả về (products, movements); builder nhận (products, movements)
+# và trả về giá trị cần cache
+# Dữ liệu trong cache là bản dùng chung, chỉ đọc cho mọi phiên. Khi nguồn đổi, luồng đầu tiên
+# giữ khóa làm mới của nguồn để dựng bản mới; trong lúc đó các phiên khác vẫn đọc bản cũ,
+# bản mới chỉ thay thế bản cũ khi đã dựng xong
+# Trả về (giá trị, chữ ký của bản được trả về): khi đang dùng tạm bản cũ thì là chữ ký cũ,
+# nên người gọi dùng chữ ký này (không phải file_signature hiện tại) làm khóa cache kết quả
+def _get(key, signature, name, build_dataset, builder=None):
+    with _lock:
+        source_lock = _source_locks.setdefault(key, threading.RLock())
+        entry = _cache.get(key)
+    if entry is not None and entry[0] == signature and name in entry[1]:
+        return entry[1][name], entry[0]
+
+    if not source_lock.acquire(blocking=False):
+        if entry is not None and name in entry[1]:
+            # Một luồng khác đang làm mới nguồn này: tạm dùng bản cũ
+            return entry[1][name], entry[0]
+        source_lock.acquire()
+    try:
+        with _lock:
+            entry = _cache.get(key)
+        if entry is None or entry[0] != signature:
+            # Nguồn đã thay đổi: bỏ toàn bộ bảng dẫn xuất cũ của nguồn này
+            entry = (signature, {})
+        derived = entry[1]
+        if "dataset" not in derived:
+            derived["dataset"] = build_dataset()
+        if name not in derived:
+            derived[name] = builder(*derived["dataset"])
+        with _lock:
+            _cache[key] = entry
+        return derived[name], entry[0]
+    finally:
+        source_lock.release()
+
+
+# Hàm lấy giá trị dẫn xuất (đã memo hóa) từ file dữ liệu
+# with_version=True: trả về (giá trị, chữ ký file của bản dữ liệu đã dựng ra giá trị)
+def load_derived(path, name, builder, with_version=False):
+    key = os.path.abspath(path)
+    value, signature = _get(key, file_signature(key), name, lambda: ingest_file(key), builder)
+    return (value, signature) if with_version else value
+
+
+# Hàm đọc dữ liệu đã ingest: (bảng sản phẩm, bảng biến động kho theo ngày)
+# Bảng sản phẩm được trả về dạng bản sao để tab có thể thêm cột;
+# bảng biến động dùng chung, chỉ đọc
+def load_dataset(path):
+    products, movements = load_derived(path, "dataset", lambda p, m: (p, m))
+    return products.copy(), movements
+
+
+# Hàm đọc kho tổng hợp dựng sẵn (sản phẩm × ngày, theo loại sản phẩm)
+def load_aggregate_store(path, with_version=False):
+    def build(products, movements):
+        store = _incremental(path)
+        if store is None:
+            return AggregateStore(products, movements).freeze()
+        return AggregateStore(products, movements, store.prefix_index("stock_decreased"), store.total_units()).freeze()
+    return load_derived(path, "aggregate_store", build, with_version)
+
+
+# Hàm đọc bảng tồn kho theo ngày dựng lại từ biến động kho
+def load_inventory(path, with_version=False):
+    def build(products, movements):
+        store = _incremental(path)
+        if store is None:
+            return InventoryLevels(products, movements).freeze()
+        return InventoryLevels(products, movements, store.prefix_index("stock_increased"),
+                               store.prefix_index("stock_decreased")).freeze()
+    return load_derived(path, "inventory", build, with_version)
+
+
+# Mô hình dự báo gần nhất của từng file nguồn; giữ qua các lần file đổi để khi file chỉ có
+# thêm ngày mới thì mô hình được cập nhật tăng dần thay vì khớp lại từ đầu
+_forecasts = {}
+
+
+# Hàm đọc mô hình dự báo số lượng bán của file dữ liệu
+def load_forecast(path, with_version=False):
+    key = os.path.abspath(path)
+
+    def build(products, movements):
+        with _lock:
+            previous = _forecasts.get(key)
+        store = _incremental(path)
+        index = None if store is None else store.prefix_index("stock_decreased")
+        model = fit_forecast(products, movements, previous, index).freeze()
+        with _lock:
+            _forecasts[key] = model
+        return model
+    return load_derived(path, "forecast", build, with_version)
+
+
+# Hàm mở kho SQLite của file dữ liệu; CSDL chỉ được dựng lại khi file nguồn thay đổi
+# Cache riêng để bảng biến động không bị giữ trong bộ nhớ
+def load_sql_store(path, with_version=False):
+    key = os.path.abspath(path)
+    signature = file_signature(key)
+    store, signature = _get(f"sqlite:{key}", signature, "sql_store", lambda: (),
+                            lambda: open_sql_store(key + SQLITE_SUFFIX, signature, lambda: ingest_file(key)))
+    return (store, signature) if with_version else store
+
+
+# Hàm đọc kho truy vấn theo QUERY_ENGINE; hai bộ máy trả về cùng số liệu
+def load_query_store(path, with_version=False):
+    if QUERY_ENGINE == "sqlite":
+        return load_sql_store(path, with_version)
+    return load_aggregate_store(path, with_version)
+
+
+# Hàm đọc dữ liệu từ file người dùng tải lên, cache theo tên file và mã băm nội dung
+def _load_uploaded(uploaded_file, name, builder):
+    data = uploaded_file.getvalue()
+    key = f"upload:{uploaded_file.name}"
+    signature = hashlib.sha1(data).hexdigest()
+    value = _get(key, signature, name,
+                 lambda: to_memory_layout(*ingest(read_source(io.BytesIO(data), uploaded_file.name))), builder)[0]
+    with _lock:
+        _uploads[key] = True
+        _uploads.move_to_end(key)
+        while len(_uploads) > UPLOAD_CACHE_SIZE:
+            evicted, _ = _uploads.popitem(last=False)
+            _cache.pop(evicted, None)
+            _source_locks.pop(evicted, None)
+    return value
+
+
+# Hàm đọc kho tổng hợp dựng từ file tải lên
+def load_uploaded_aggregate_store(uploaded_file):
+    return _load_uploaded(uploaded_file, "aggregate_store", lambda p, m: AggregateStore(p, m).freeze())
+
+
+# Chuyển đổi trước các file nguồn sang Parquet (chạy khi deploy):
+#   python data_loader.py kf_coffee.csv "kf_coffee (1).xlsx"
+if __name__ == "__main__":
+    for source_path in sys.argv[1:]:
+        write_parquet_cache(source_path, *ingest(read_source(source_path)))
+        print(f"Đã ghi cache Parquet cho {source_path}")
@@ -0,0 +1,179 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Bật sẵn bảng chẩn đoán cho mọi phiên (người dùng vẫn tắt được trên sidebar)
+DIAGNOSTICS_DEFAULT = os.environ.get("COFFEE_DIAGNOSTICS") == "1"
+
+# File JSON Lines để ghi kết quả đo cho hệ thống giám sát (không đặt thì không ghi)
+DIAGNOSTICS_LOG = os.environ.get("COFFEE_DIAGNOSTICS_LOG")
+
+# Mỗi lần chạy script của một phiên chạy trên một luồng riêng; kết quả đo gắn với luồng đó
+# Khi không có lần đo nào đang chạy, mỗi bước chỉ tốn một lần đọc thuộc tính
+_local = threading.local()
+_log_lock = threading.Lock()
+_memory_runs = 0
+
+
+# Hàm đọc bộ nhớ thường trú (RSS) hiện tại của tiến trình, MB
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # Nền tảng không có /proc: chỉ có RSS đỉnh (KB trên Linux, byte trên macOS)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+        except ImportError:
+            return None
+
+
+# Hàm bắt đầu một lần đo cho luồng hiện tại; memory=True thì đo thêm bộ nhớ cấp phát bằng tracemalloc
+# (tracemalloc tác động toàn tiến trình nên chỉ nên bật khi cần)
+def start_run(app, memory=False):
+    global _memory_runs
+    finish_run(write_log=False)
+    if memory:
+        with _log_lock:
+            if _memory_runs == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _memory_runs += 1
+    _local.run = {"app": app, "memory": memory, "records": [], "stack": [],
+                  "started": time.time()}
+
+
+# Hàm kết thúc lần đo của luồng hiện tại, trả về danh sách kết quả từng bước
+def finish_run(write_log=True):
+    global _memory_runs
+    run = getattr(_local, "run", None)
+    if run is None:
+        return []
+    _local.run = None
+    if run["memory"]:
+        with _log_lock:
+            _memory_runs -= 1
+            if _memory_runs == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+    if write_log and DIAGNOSTICS_LOG:
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(run["started"]))
+        with _log_lock, open(DIAGNOSTICS_LOG, "a", encoding="utf-8") as f:
+            for record in run["records"]:
+                f.write(json.dumps({"timestamp": timestamp, "app": run["app"], **record},
+                                   ensure_ascii=False) + "\n")
+    return run["records"]
+
+
+# Bước đo: thời gian, RSS trước/sau và bộ nhớ cấp phát đỉnh trong bước (khi bật tracemalloc)
+class _Stage:
+    __slots__ = ("name", "run", "start", "rss", "base", "peak")
+
+    def __init__(self, name, run):
+        self.name = name
+        self.run = run
+
+    def __enter__(self):
+        if self.run["memory"] and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # Lưu đỉnh của bước cha trước khi đặt lại bộ đếm đỉnh cho bước này
+            if self.run["stack"]:
+                parent = self.run["stack"][-1]
+                parent.peak = max(parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.base = self.peak = current
+        else:
+            self.base = None
+        self.rss = rss_mb()
+        self.run["stack"].append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.run["stack"].pop()
+        rss = rss_mb()
+        record = {
+            "stage": self.name,
+            "depth": len(self.run["stack"]),
+            "seconds": seconds,
+            "rss_mb": rss,
+            "rss_delta_mb": None if rss is None or self.rss is None else rss - self.rss,
+            "peak_alloc_mb": None,
+        }
+        if self.base is not None and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            record["peak_alloc_mb"] = (self.peak - self.base) / 1e6
+            if self.run["stack"]:
+                parent = self.run["stack"][-1]
+                parent.peak = max(parent.peak, self.peak)
+        self.run["records"].append(record)
+        return False
+
+
+# Bước rỗng khi không đo
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+# Hàm đo một đoạn mã: with stage("render:top10"): ...
+def stage(name):
+    run = getattr(_local, "run", None)
+    if run is None:
+        return _NO_STAGE
+    return _Stage(name, run)
+
+
+# Decorator đo mỗi lần gọi hàm như một bước
+def instrument(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = getattr(_local, "run", None)
+            if run is None:
+                return func(*args, **kwargs)
+            with _Stage(name, run):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Hàm bật đo cho một app Streamlit theo hộp chọn trên sidebar; trả về True nếu đang đo
+def begin_app(app):
+    import streamlit as st
+    enabled = st.sidebar.checkbox("🩺 Chẩn đoán hiệu năng", value=DIAGNOSTICS_DEFAULT, key="diagnostics")
+    if enabled:
+        memory = st.sidebar.checkbox("Đo bộ nhớ cấp phát (tracemalloc)", key="diagnostics_memory")
+        start_run(app, memory)
+    else:
+        finish_run(write_log=False)
+    return enabled
+
+
+# Hàm kết thúc lần đo của app và hiện bảng kết quả trên sidebar
+def end_app():
+    import pandas as pd
+    import streamlit as st
+    if getattr(_local, "run", None) is None:
+        return
+    records = finish_run()
+    with st.sidebar.expander("🩺 Chẩn đoán", expanded=True):
+        if not records:
+            st.caption("Không có bước nào được đo (dữ liệu đã có sẵn trong cache).")
+            return
+        table = pd.DataFrame(records)
+        table["stage"] = ["  " * depth + name for depth, name in zip(table["depth"], table["stage"])]
+        total = table.loc[table["depth"] == 0, "seconds"].sum()
+        st.caption(f"Tổng thời gian các bước: {total * 1000:,.1f} ms")
+        st.dataframe(table.drop(columns="depth"), width="stretch", hide_index=True)
@@ -0,0 +1,47 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+from diagnostics import instrument
+
+# Số ảnh biểu đồ giữ lại trong bộ nhớ (bỏ ảnh ít dùng nhất khi đầy)
+FIGURE_CACHE_SIZE = 64
+
+# Tùy chọn lưu ảnh, giống mặc định của st.pyplot
+SAVEFIG_OPTIONS = {"format": "png", "dpi": 200, "bbox_inches": "tight"}
+
+# Bộ nhớ đệm dùng chung cho mọi phiên trong tiến trình: khóa -> ảnh PNG
+_figures = OrderedDict()
+_lock = threading.Lock()
+
+
+# Hàm lấy ảnh PNG của biểu đồ theo khóa (loại biểu đồ, kỳ, phiên bản dữ liệu, ...)
+# Chưa có thì gọi draw() để vẽ figure, lưu thành ảnh rồi đóng figure để giải phóng bộ nhớ
+@instrument("render_png")
+def render_png(key, draw):
+    with _lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+
+    fig = draw()
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    finally:
+        plt.close(fig)
+    png = buffer.getvalue()
+
+    with _lock:
+        _figures[key] = png
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return png
+
+
+# Hàm xóa toàn bộ ảnh đã cache
+def clear_figures():
+    with _lock:
+        _figures.clear()
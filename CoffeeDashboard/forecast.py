@@ -0,0 +1,157 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from aggregates import PrefixSumIndex
+from diagnostics import instrument
+
+# Số ngày dự báo mặc định
+FORECAST_HORIZON = 7
+
+# Chu kỳ mùa vụ theo thứ trong tuần
+SEASON_LENGTH = 7
+
+# Lưới tham số làm trơn thử cho mọi sản phẩm cùng lúc; mỗi sản phẩm chọn bộ có sai số
+# dự báo một bước nhỏ nhất. beta = gamma = 0 là làm trơn mũ đơn (SES), gamma = 0 là Holt
+ALPHAS = (0.1, 0.3, 0.5, 0.8)
+BETAS = (0.0, 0.05, 0.2)
+GAMMAS = (0.0, 0.1, 0.3)
+
+# Sau số ngày mới này (cập nhật tăng dần) thì khớp lại tham số từ đầu
+REFIT_AFTER_DAYS = 28
+
+# Số ngày lịch sử gần nhất giữ lại trong mô hình để vẽ và so sánh với dự báo
+RECENT_DAYS = 28
+
+
+# Hàm chạy làm trơn Holt-Winters (xu hướng cộng, mùa vụ cộng theo thứ) trên ma trận sản phẩm × ngày
+# Vòng lặp chỉ chạy theo ngày, mỗi bước là phép toán vector trên mọi sản phẩm (và mọi bộ tham số
+# khi alpha/beta/gamma có thêm trục đầu cho lưới tham số)
+# season: mảng (..., sản phẩm, 7) theo thứ (0 = thứ Hai), được cập nhật tại chỗ
+# Trả về (level, trend, season, tổng bình phương sai số dự báo một bước)
+def smooth(demand, alpha, beta, gamma, level, trend, season, first_weekday):
+    sse = np.zeros(np.broadcast(alpha, level).shape)
+    for t in range(demand.shape[1]):
+        weekday = (first_weekday + t) % SEASON_LENGTH
+        y = demand[:, t]
+        s = season[..., weekday]
+        error = y - (level + trend + s)
+        sse += error * error
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season[..., weekday] = gamma * (y - new_level) + (1 - gamma) * s
+        level = new_level
+    return level, trend, season, sse
+
+
+# Hàm khởi tạo trạng thái từ tuần đầu tiên: level là trung bình, mùa vụ là chênh lệch theo thứ
+def initial_state(demand, first_weekday):
+    first_week = demand[:, :SEASON_LENGTH]
+    level = first_week.mean(axis=1) if first_week.shape[1] else np.zeros(len(demand))
+    season = np.zeros((len(demand), SEASON_LENGTH))
+    if first_week.shape[1] == SEASON_LENGTH:
+        weekdays = (first_weekday + np.arange(SEASON_LENGTH)) % SEASON_LENGTH
+        season[:, weekdays] = first_week - level[:, None]
+    return level, np.zeros(len(demand)), season
+
+
+# Mô hình dự báo số lượng bán (stock_decreased) theo ngày cho toàn bộ danh mục
+# Giữ tham số đã khớp và trạng thái cuối (level, trend, mùa vụ) của từng sản phẩm, nên khi có
+# ngày mới chỉ cần chạy tiếp phần làm trơn trên các ngày đó
+# products: bảng sản phẩm (product_id, name) theo thứ tự dòng của ma trận
+class DemandForecast:
+    def __init__(self, products, first_date, demand, params, state, fit_mode, new_days):
+        self.product_ids = products["product_id"].to_numpy()
+        self.names = products["name"].to_numpy()
+        self.first_date = first_date
+        self.n_days = demand.shape[1]
+        self.checksum = history_checksum(demand)
+        self.recent = demand[:, -RECENT_DAYS:].copy()
+        self.alpha, self.beta, self.gamma, self.fitted_days = params
+        self.level, self.trend, self.season, self.sse = state
+        self.fit_mode = fit_mode
+        self.new_days = new_days
+
+    @property
+    def last_date(self):
+        return self.first_date + pd.Timedelta(days=self.n_days - 1)
+
+    # Hàm khóa ghi các mảng: mô hình được dùng chung giữa các phiên
+    def freeze(self):
+        for array in (self.level, self.trend, self.season, self.alpha, self.beta, self.gamma, self.recent):
+            array.flags.writeable = False
+        return self
+
+    # Hàm khớp toàn bộ: thử mọi bộ tham số của lưới cho mọi sản phẩm trong một lần chạy
+    @classmethod
+    @instrument("forecast_fit")
+    def fit(cls, demand, products, first_date):
+        first_weekday = first_date.weekday()
+        grid = np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS)))
+        alpha, beta, gamma = (grid[:, i, None] for i in range(3))
+        level, trend, season = initial_state(demand, first_weekday)
+        n_grid = len(grid)
+        level, trend, season, sse = smooth(demand, alpha, beta, gamma,
+                                           np.tile(level, (n_grid, 1)), np.tile(trend, (n_grid, 1)),
+                                           np.tile(season, (n_grid, 1, 1)), first_weekday)
+
+        best = sse.argmin(axis=0)
+        rows = np.arange(demand.shape[0])
+        params = (grid[best, 0], grid[best, 1], grid[best, 2], demand.shape[1])
+        state = (level[best, rows], trend[best, rows], season[best, rows], sse[best, rows])
+        return cls(products, first_date, demand, params, state, "full", demand.shape[1])
+
+    # Hàm cập nhật với lịch sử mới: nếu chỉ có thêm ngày ở cuối thì chạy tiếp làm trơn trên các
+    # ngày mới với tham số cũ; khớp lại từ đầu khi danh mục/lịch sử cũ thay đổi hoặc đã đủ
+    # REFIT_AFTER_DAYS ngày kể từ lần khớp tham số gần nhất
+    @instrument("forecast_update")
+    def update(self, demand, products, first_date):
+        n_days = demand.shape[1]
+        compatible = (first_date == self.first_date and n_days >= self.n_days
+                      and np.array_equal(products["product_id"].to_numpy(), self.product_ids)
+                      and np.allclose(history_checksum(demand[:, :self.n_days]), self.checksum))
+        if not compatible or n_days - self.fitted_days >= REFIT_AFTER_DAYS:
+            return DemandForecast.fit(demand, products, first_date)
+        if n_days == self.n_days:
+            return self
+
+        new = demand[:, self.n_days:]
+        weekday = (first_date.weekday() + self.n_days) % SEASON_LENGTH
+        level, trend, season, sse = smooth(new, self.alpha, self.beta, self.gamma,
+                                           self.level.copy(), self.trend.copy(), self.season.copy(), weekday)
+        params = (self.alpha, self.beta, self.gamma, self.fitted_days)
+        state = (level, trend, season, self.sse + sse)
+        return DemandForecast(products, first_date, demand, params, state,
+                              "incremental", n_days - self.n_days)
+
+    # Dự báo horizon ngày tiếp theo: ma trận sản phẩm × ngày (không âm) và các ngày tương ứng
+    def predict(self, horizon=FORECAST_HORIZON):
+        steps = np.arange(1, horizon + 1)
+        weekdays = (self.first_date.weekday() + self.n_days - 1 + steps) % SEASON_LENGTH
+        forecast = self.level[:, None] + self.trend[:, None] * steps + self.season[:, weekdays]
+        dates = pd.date_range(self.last_date + pd.Timedelta(days=1), periods=horizon)
+        return np.maximum(forecast, 0.0), dates
+
+    # Số lượng bán của days ngày gần nhất (tối đa RECENT_DAYS): ma trận sản phẩm × ngày và các ngày
+    def history(self, days=RECENT_DAYS):
+        recent = self.recent[:, -days:]
+        return recent, pd.date_range(end=self.last_date, periods=recent.shape[1])
+
+
+# Tổng và tổng có trọng số theo ngày của lịch sử từng sản phẩm, dùng để nhận ra lịch sử cũ bị sửa
+def history_checksum(demand):
+    return np.stack([demand.sum(axis=1), demand @ np.arange(1, demand.shape[1] + 1)], axis=1)
+
+
+# Hàm dựng (hoặc cập nhật) mô hình dự báo từ dữ liệu đã ingest
+# previous: mô hình của lần trước cho cùng nguồn, dùng lại tham số và trạng thái nếu được
+# index: chỉ mục tích lũy stock_decreased dựng sẵn (kho tăng dần)
+def fit_forecast(products, movements, previous=None, index=None):
+    products = products.reset_index(drop=True)
+    if index is None:
+        index = PrefixSumIndex(products, movements, "stock_decreased")
+    demand = np.diff(index.cumulative, axis=1)
+    if previous is None:
+        return DemandForecast.fit(demand, products, index.first_date)
+    return previous.update(demand, products, index.first_date)
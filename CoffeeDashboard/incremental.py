@@ -0,0 +1,237 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregates import PrefixSumIndex
+from ingest import STOCK_COLUMNS, build_product_table, json_loads, movements_from_histories, parse_history
+from schema import EPOCH, movement_days
+
+# Mẫu tìm giá trị "date" của một mục trong chuỗi JSON stock_history
+DATE_PATTERN = re.compile(r'"date"\s*:\s*"(\d{4}-\d{2}-\d{2})"')
+
+# Hệ số nới sức chứa của ma trận tích lũy: khi hết chỗ cho ngày/sản phẩm mới thì cấp phát
+# gấp CAPACITY_GROWTH lần, nên các lần làm mới thêm một ngày hầu như không phải cấp phát lại
+CAPACITY_GROWTH = 1.5
+
+
+# Hàm lấy các mục mới hơn last_date (chuỗi YYYY-MM-DD) mà không giải mã toàn bộ JSON
+# Lịch sử được xuất theo thứ tự ngày tăng dần nên chỉ cần duyệt ngược từ cuối chuỗi
+# đến mục cũ đầu tiên rồi giải mã phần đuôi; chuỗi lạ thì giải mã toàn bộ rồi lọc
+def tail_entries(history_str, last_date):
+    if not isinstance(history_str, str):
+        return []
+    if last_date is None:
+        return parse_history(history_str)
+
+    pos = len(history_str)
+    cut = None
+    while True:
+        pos = history_str.rfind('"date"', 0, pos)
+        if pos < 0:
+            break
+        match = DATE_PATTERN.match(history_str, pos)
+        if match is None or match.group(1) <= last_date:
+            break
+        cut = pos
+    if cut is None:
+        return []
+
+    start = history_str.rfind("{", 0, cut)
+    end = history_str.rfind("]")
+    try:
+        entries = json_loads("[" + history_str[start:end] + "]")
+    except ValueError:
+        entries = parse_history(history_str)
+    return [e for e in entries if isinstance(e, dict) and str(e.get("date")) > last_date]
+
+
+# Kho dữ liệu tăng dần: nhớ ngày cuối đã ingest của từng sản phẩm, mỗi lần làm mới
+# chỉ tách các mục mới rồi cộng dồn vào tổng bán và ma trận tổng tích lũy theo ngày
+# (sản phẩm × ngày, cho từng cột số lượng). Kho tổng hợp, bảng tồn kho và mô hình dự báo
+# dựng từ các ma trận này (prefix_index) thay vì cộng lại toàn bộ bảng biến động
+# Sản phẩm được nhận diện theo tên vì thứ tự dòng có thể đổi giữa các lần xuất
+# layout: hàm đổi một phần biến động sang dạng lưu trong bộ nhớ (ví dụ compact_movements),
+# áp dụng một lần cho mỗi phần mới
+class IncrementalStore:
+    def __init__(self, state_dir=None, layout=None):
+        self.state_dir = state_dir
+        self.layout = layout
+        self.products = build_product_table(pd.DataFrame(columns=["name", "stock_history"]))
+        self.movement_parts = []
+        # Các biến động mới chưa ghi xuống đĩa
+        self.pending_parts = []
+        self.totals = pd.DataFrame({
+            "last_date": pd.Series(dtype="datetime64[ns]"),
+            "units": pd.Series(dtype=np.float64),
+        }, index=pd.Index([], dtype=np.int64, name="product_id"))
+        # Ngày đầu (số ngày kể từ EPOCH) của các ma trận tích lũy; cột j là tổng trước ngày first_day + j
+        self.first_day = None
+        # cumulative[column] là phần đang dùng (sản phẩm × số ngày + 1) của _buffers[column],
+        # ma trận có thêm chỗ trống cho sản phẩm và ngày mới
+        self._buffers = {column: np.zeros((0, 1)) for column in STOCK_COLUMNS}
+        self.cumulative = dict(self._buffers)
+        # Bảng biến động đã nối và các chỉ mục tích lũy đã sao chép, dùng lại đến lần làm mới sau
+        self._movements = None
+        self._indexes = {}
+        if state_dir and os.path.isdir(state_dir):
+            self.load()
+
+    # Bảng biến động đầy đủ; các phần chỉ được nối một lần sau mỗi lần làm mới
+    @property
+    def movements(self):
+        if self._movements is None:
+            if not self.movement_parts:
+                empty = movements_from_histories([], [])
+                self._movements = empty if self.layout is None else self.layout(empty)
+            else:
+                if len(self.movement_parts) > 1:
+                    self.movement_parts = [pd.concat(self.movement_parts, ignore_index=True)]
+                self._movements = self.movement_parts[0]
+        return self._movements
+
+    # Hàm gán product_id ổn định theo tên, sản phẩm mới nhận id tiếp theo
+    def _product_ids(self, names):
+        known = pd.Series(self.products["product_id"].to_numpy(), index=self.products["name"])
+        known = known[~known.index.duplicated()]
+        ids = pd.Series(known.reindex(names).to_numpy(), dtype="float64")
+        missing = ids.isna().to_numpy()
+        next_id = int(self.products["product_id"].max()) + 1 if len(self.products) else 0
+        new_names = pd.unique(np.asarray(names)[missing])
+        new_ids = dict(zip(new_names, range(next_id, next_id + len(new_names))))
+        ids[missing] = [new_ids[name] for name in np.asarray(names)[missing]]
+        return ids.astype(np.int64).to_numpy()
+
+    # Hàm làm mới từ một bản xuất đầy đủ; trả về số mục lịch sử mới đã ingest
+    # Tên xuất hiện nhiều lần trong một bản xuất chỉ giữ dòng cuối, vì sản phẩm nhận diện theo tên
+    def update(self, df):
+        df = df.drop_duplicates("name", keep="last").reset_index(drop=True)
+        ids = self._product_ids(df["name"])
+        last_dates = self.totals["last_date"].reindex(ids)
+        last_strings = [None if pd.isna(d) else f"{d:%Y-%m-%d}" for d in last_dates]
+        histories = [tail_entries(h, d) for h, d in zip(df["stock_history"], last_strings)]
+        new = movements_from_histories(histories, ids)
+
+        # Thuộc tính sản phẩm lấy theo bản xuất mới nhất
+        export = build_product_table(df)
+        export["product_id"] = ids
+        kept = self.products[~self.products["product_id"].isin(ids)]
+        self.products = pd.concat([kept, export], ignore_index=True).sort_values("product_id", ignore_index=True)
+        if not self.products["product_id"].is_unique:
+            raise ValueError("product_id trong kho tăng dần bị trùng")
+
+        self._accumulate(new)
+        if new.empty:
+            return 0
+
+        # Cộng dồn tổng bán (kể cả các mục có ngày lỗi) và ngày cuối của từng sản phẩm
+        grouped = new.groupby("product_id")
+        delta = pd.DataFrame({
+            "last_date": grouped["date"].max(),
+            "units": grouped["stock_decreased"].sum(),
+        })
+        totals = self.totals.reindex(self.totals.index.union(delta.index))
+        totals["units"] = totals["units"].fillna(0.0).add(delta["units"], fill_value=0.0)
+        totals["last_date"] = pd.concat([totals["last_date"], delta["last_date"]], axis=1).max(axis=1)
+        self.totals = totals
+
+        new = new if self.layout is None else self.layout(new)
+        self.movement_parts.append(new)
+        self.pending_parts.append(new)
+        self._movements = None
+        return len(new)
+
+    # Hàm cộng các biến động mới vào ma trận tích lũy tại chỗ: ma trận chỉ được nới thêm dòng cho
+    # sản phẩm mới và cột cho ngày mới, rồi chỉ các sản phẩm có biến động mới, từ ngày mới sớm nhất
+    # trở đi, được cộng thêm. Với một ngày mới mỗi lần làm mới, chi phí tỉ lệ với một ngày dữ liệu
+    # Ma trận nằm trong _buffers có chỗ trống dư, chỉ cấp phát lại khi hết chỗ hoặc có ngày
+    # mới trước ngày đầu
+    def _accumulate(self, movements):
+        days, valid = movement_days(movements)
+        days = days[valid]
+        first, last = self.first_day, self.last_day
+        if len(days):
+            first = int(days.min()) if first is None else min(first, int(days.min()))
+            last = int(days.max()) if last is None else max(last, int(days.max()))
+        n_days = 0 if first is None else last - first + 1
+        n_products = len(self.products)
+        left = 0 if self.first_day is None else self.first_day - first
+        self._indexes = {}
+
+        for column in STOCK_COLUMNS:
+            cumulative = self.cumulative[column]
+            if cumulative.shape != (n_products, n_days + 1):
+                rows, width = cumulative.shape
+                buffer = self._buffers[column]
+                if left or n_products > buffer.shape[0] or n_days + 1 > buffer.shape[1]:
+                    # Ngày mới thêm ở đầu có tổng tích lũy 0; dòng/cột trống mới cũng là 0
+                    buffer = np.zeros((max(n_products, int(buffer.shape[0] * CAPACITY_GROWTH)),
+                                       max(n_days + 1, int(buffer.shape[1] * CAPACITY_GROWTH))))
+                    buffer[:rows, left:left + width] = cumulative
+                    self._buffers[column] = buffer
+                # Ngày mới thêm ở cuối giữ tổng của ngày cuối cũ
+                buffer[:rows, left + width:n_days + 1] = buffer[:rows, left + width - 1:left + width]
+                cumulative = self.cumulative[column] = buffer[:n_products, :n_days + 1]
+            if not len(days):
+                continue
+
+            rows = pd.Index(self.products["product_id"]).get_indexer(movements["product_id"].to_numpy()[valid])
+            cols = days - first
+            start = int(cols.min())
+            affected, codes = np.unique(rows, return_inverse=True)
+            width = n_days - start
+            daily = np.bincount(codes * width + (cols - start),
+                                weights=movements[column].to_numpy(dtype=np.float64)[valid],
+                                minlength=len(affected) * width).reshape(len(affected), width)
+            cumulative[affected, start + 1:] += np.cumsum(daily, axis=1)
+        self.first_day = first
+
+    @property
+    def last_day(self):
+        if self.first_day is None:
+            return None
+        return self.first_day + self.cumulative[STOCK_COLUMNS[0]].shape[1] - 2
+
+    # Chỉ mục tổng tích lũy của một cột số lượng theo thứ tự bảng sản phẩm, giống
+    # PrefixSumIndex(products, movements, column) nhưng không đọc lại bảng biến động
+    # Ma trận được sao chép vì kho tiếp tục cộng dồn tại chỗ ở các lần làm mới sau; bản sao
+    # chỉ tạo một lần cho mỗi lần làm mới và dùng chung cho mọi bảng dẫn xuất (chỉ đọc)
+    def prefix_index(self, column="stock_decreased"):
+        if column not in self._indexes:
+            if self.first_day is None:
+                index = PrefixSumIndex(self.products, self.movements, column)
+            else:
+                first_date = EPOCH + pd.Timedelta(days=self.first_day)
+                index = PrefixSumIndex.from_cumulative(pd.RangeIndex(len(self.products)), first_date,
+                                                       self.cumulative[column].copy())
+            self._indexes[column] = index
+        return self._indexes[column]
+
+    # Tổng bán toàn thời gian của từng sản phẩm theo thứ tự bảng sản phẩm
+    def total_units(self):
+        return self.totals["units"].reindex(self.products["product_id"], fill_value=0.0).to_numpy(dtype=np.float64)
+
+    # Hàm ghi trạng thái: biến động mới được ghi thành một phần Parquet riêng
+    def save(self):
+        os.makedirs(os.path.join(self.state_dir, "movements"), exist_ok=True)
+        self.products.to_parquet(os.path.join(self.state_dir, "products.parquet"), index=False)
+        self.totals.reset_index().to_parquet(os.path.join(self.state_dir, "totals.parquet"), index=False)
+        if self.pending_parts:
+            written = len(glob.glob(os.path.join(self.state_dir, "movements", "part-*.parquet")))
+            part = pd.concat(self.pending_parts, ignore_index=True)
+            part.to_parquet(os.path.join(self.state_dir, "movements", f"part-{written:06d}.parquet"), index=False)
+            self.pending_parts = []
+
+    # Hàm đọc lại trạng thái đã lưu; ma trận tích lũy được dựng lại một lần từ các phần biến động
+    def load(self):
+        self.products = pd.read_parquet(os.path.join(self.state_dir, "products.parquet"))
+        totals = pd.read_parquet(os.path.join(self.state_dir, "totals.parquet")).set_index("product_id")
+        self.totals = totals[["last_date", "units"]]
+        self.movement_parts = [pd.read_parquet(p) for p in sorted(
+            glob.glob(os.path.join(self.state_dir, "movements", "part-*.parquet")))]
+        if self.layout is not None:
+            self.movement_parts = [self.layout(part) for part in self.movement_parts]
+        self._movements = None
+        self._accumulate(self.movements)
@@ -0,0 +1,167 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from categories import classify_products
+from diagnostics import instrument
+from schema import concat_tables
+
+# orjson (nếu có cài) giải mã nhanh hơn json chuẩn nhiều lần
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Các cột số lượng trong mỗi mục của stock_history
+STOCK_COLUMNS = ["stock_increased", "stock_decreased"]
+
+# Số tiến trình giải mã JSON song song (None = số lõi CPU, 1 = luôn chạy tuần tự)
+DECODE_WORKERS = None
+# Dưới số dòng này thì giải mã tuần tự, vì chi phí khởi tạo tiến trình lớn hơn lợi ích
+PARALLEL_MIN_ROWS = 5000
+
+
+# Hàm đọc chuỗi JSON stock_history, dữ liệu lỗi trả về danh sách rỗng
+def parse_history(history_str):
+    try:
+        history = json_loads(history_str).get("stock_history", [])
+        return history if isinstance(history, list) else []
+    except (TypeError, ValueError, AttributeError):
+        return []
+
+
+# Hàm tạo bảng sản phẩm: mỗi dòng một sản phẩm, có product_id, bỏ cột JSON thô
+# và thêm loại bao bì / loại cà phê phân loại từ tên (chỉ chạy một lần lúc ingest)
+# first_id: product_id của dòng đầu tiên (dùng khi đọc theo từng khối)
+def build_product_table(df, first_id=0):
+    products = df.drop(columns=["stock_history"], errors="ignore").reset_index(drop=True)
+    products.insert(0, "product_id", np.arange(first_id, first_id + len(products), dtype=np.int64))
+    return classify_products(products)
+
+
+# Hàm dựng bảng biến động từ danh sách lịch sử (mỗi phần tử là list các mục dict)
+# product_ids: product_id tương ứng với từng lịch sử
+def movements_from_histories(histories, product_ids):
+    histories = [[e for e in h if isinstance(e, dict)] for h in histories]
+    lengths = np.fromiter((len(h) for h in histories), dtype=np.int64, count=len(histories))
+    entries = [entry for history in histories for entry in history]
+
+    movements = pd.DataFrame({
+        "product_id": np.repeat(np.asarray(product_ids, dtype=np.int64), lengths),
+        "date": pd.to_datetime([e.get("date") for e in entries], format="%Y-%m-%d", errors="coerce"),
+    })
+    for column in STOCK_COLUMNS:
+        raw = [e.get(column, 0) for e in entries]
+        try:
+            # Đường nhanh: mọi giá trị đều là số hoặc chuỗi số hợp lệ
+            values = np.array(raw, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = pd.to_numeric(pd.Series(raw, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        movements[column] = np.nan_to_num(values, nan=0.0)
+    return movements
+
+
+# Hàm tách stock_history thành bảng dài (product_id, date, stock_increased, stock_decreased)
+# JSON của mỗi sản phẩm chỉ được giải mã đúng một lần, phần còn lại là thao tác vector
+# Với file lớn, các dòng được chia khối cho nhiều tiến trình rồi ghép kết quả theo thứ tự
+# pool: nhóm tiến trình (decode_pool) dùng chung cho nhiều lần gọi; None thì tự tạo rồi đóng
+def explode_stock_history(df, first_id=0, workers=None, pool=None):
+    strings = df["stock_history"].tolist()
+    workers = decode_workers(workers, len(strings))
+    if workers <= 1:
+        return _explode_strings(strings, first_id)
+    if pool is None:
+        with decode_pool(workers) as pool:
+            return _explode_parallel(pool, strings, first_id, workers)
+    return _explode_parallel(pool, strings, first_id, workers)
+
+
+# Hàm chia các chuỗi JSON thành nhiều phần, giải mã song song trên pool rồi ghép theo thứ tự
+def _explode_parallel(pool, strings, first_id, workers):
+    bounds = np.linspace(0, len(strings), workers * 4 + 1, dtype=np.int64)
+    parts = list(pool.map(_explode_strings,
+                          [strings[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])],
+                          [first_id + int(lo) for lo in bounds[:-1]]))
+    return pd.concat(parts, ignore_index=True)
+
+
+# Hàm giải mã và tách một khối chuỗi JSON (chạy được trong tiến trình con)
+def _explode_strings(strings, first_id):
+    histories = [parse_history(x) for x in strings]
+    return movements_from_histories(histories, np.arange(first_id, first_id + len(histories)))
+
+
+# Hàm chọn số tiến trình giải mã: file nhỏ luôn chạy tuần tự
+def decode_workers(workers, n_rows):
+    if workers is None:
+        workers = DECODE_WORKERS if DECODE_WORKERS is not None else (os.cpu_count() or 1)
+    if n_rows < PARALLEL_MIN_ROWS:
+        return 1
+    return max(1, min(int(workers), n_rows))
+
+
+# Hàm tạo nhóm tiến trình giải mã. Không dùng fork: fork từ tiến trình nhiều luồng (Streamlit)
+# sao chép cả các khóa đang bị luồng khác giữ nên tiến trình con có thể bị treo
+def decode_pool(workers):
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+# Hàm ingest: trả về (bảng sản phẩm, bảng biến động kho theo ngày)
+@instrument("parse")
+def ingest(df, workers=None):
+    return build_product_table(df), explode_stock_history(df, workers=workers)
+
+
+# Hàm gộp bảng biến động về một dòng cho mỗi (sản phẩm, ngày)
+# Các mục có ngày lỗi (NaT) vẫn được giữ để tổng toàn kỳ không đổi
+def daily_totals(movements):
+    return movements.groupby(["product_id", "date"], sort=False, dropna=False)[STOCK_COLUMNS].sum().reset_index()
+
+
+# Hàm đọc CSV theo từng khối, trả về lần lượt (bảng sản phẩm, bảng tổng theo ngày) của mỗi khối
+# Bộ nhớ tối đa chỉ phụ thuộc chunksize, không phụ thuộc kích thước file;
+# read_csv vẫn đọc đúng các chuỗi JSON nhiều dòng trong ngoặc kép
+# Nhóm tiến trình giải mã được tạo một lần (khi gặp khối đủ lớn) và dùng lại cho mọi khối
+def iter_csv_chunks(path, chunksize=10000, workers=None):
+    first_id = 0
+    pool = None
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk.columns = chunk.columns.str.strip().str.lower()
+            chunk_workers = decode_workers(workers, len(chunk))
+            if chunk_workers > 1 and pool is None:
+                pool = decode_pool(chunk_workers)
+            products = build_product_table(chunk, first_id)
+            movements = daily_totals(explode_stock_history(chunk, first_id, chunk_workers, pool))
+            first_id += len(chunk)
+            yield products, movements
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+# Hàm ingest CSV theo luồng: cho cùng kết quả tổng hợp với ingest(pd.read_csv(path))
+# nhưng không bao giờ giữ toàn bộ cột JSON thô trong bộ nhớ
+# layout: hàm đổi (products, movements) của từng khối sang dạng lưu trong bộ nhớ (ví dụ
+# compact_dataset) trước khi nối, để không phải giữ mọi khối ở dạng cũ cùng lúc
+@instrument("parse_chunked")
+def ingest_csv_chunked(path, chunksize=10000, layout=None):
+    product_parts = []
+    movement_parts = []
+    for products, movements in iter_csv_chunks(path, chunksize):
+        if layout is not None:
+            products, movements = layout(products, movements)
+        product_parts.append(products)
+        movement_parts.append(movements)
+    if not product_parts:
+        products, movements = ingest(pd.DataFrame(columns=["stock_history"]))
+        return (products, movements) if layout is None else layout(products, movements)
+    narrow = layout is not None
+    return concat_tables(product_parts, narrow), concat_tables(movement_parts, narrow)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import PrefixSumIndex, QueryCache
+from diagnostics import instrument
+
+# Số ngày gần nhất dùng để tính nhu cầu trung bình mỗi ngày (cho số ngày tồn kho đủ bán)
+DEMAND_WINDOW_DAYS = 7
+
+# Tồn dư: lượng tồn đủ bán quá số ngày này theo nhu cầu gần đây
+OVERSTOCK_COVER_DAYS = 60
+
+
+# Tồn kho cuối ngày của mọi sản phẩm × mọi ngày, dựng lại từ biến động kho
+# stock_quantity là tồn kho tại ngày cuối của dữ liệu, nên tồn cuối ngày j bằng
+# stock_quantity trừ đi biến động ròng (nhập − bán) của các ngày sau j. Biến động ròng cộng dồn
+# theo ngày được dựng bằng bincount như PrefixSumIndex, mọi phép tính sau đó là phép toán
+# trên ma trận sản phẩm × ngày, không lặp theo từng sản phẩm
+# Sản phẩm thiếu stock_quantity có tồn kho NaN và không bị gắn cờ
+# increased, demand: chỉ mục tích lũy dựng sẵn (kho tăng dần), cùng khoảng ngày
+class InventoryLevels:
+    @instrument("inventory")
+    def __init__(self, products, movements, increased=None, demand=None):
+        self.products = products.reset_index(drop=True)
+        if increased is None:
+            increased = PrefixSumIndex(self.products, movements, "stock_increased")
+        self.demand = PrefixSumIndex(self.products, movements, "stock_decreased") if demand is None else demand
+        self.first_date = self.demand.first_date
+        self.last_date = self.demand.last_date
+
+        anchor = pd.to_numeric(self.products.get("stock_quantity", pd.Series(np.nan, index=self.products.index)),
+                               errors="coerce").to_numpy(dtype=np.float64)
+        net = increased.cumulative - self.demand.cumulative
+        self.levels = anchor[:, None] - (net[:, -1:] - net[:, 1:])
+        self.dates = pd.date_range(self.first_date, periods=self.levels.shape[1])
+        self._cache = QueryCache()
+
+    # Hàm khóa ghi các mảng: bảng tồn kho được dùng chung giữa các phiên
+    def freeze(self):
+        for array in (self.levels, self.demand.cumulative):
+            array.flags.writeable = False
+        return self
+
+    # Hàm đổi (start, end) thành khoảng cột [lo, hi) của ma trận tồn kho
+    # (kẹp vào phạm vi dữ liệu, luôn có ít nhất một ngày)
+    def _columns(self, start=None, end=None):
+        n_days = self.levels.shape[1]
+        lo = 0 if start is None else (pd.Timestamp(start).normalize() - self.first_date).days
+        hi = n_days if end is None else (pd.Timestamp(end).normalize() - self.first_date).days + 1
+        lo = min(max(lo, 0), n_days - 1)
+        return lo, min(max(hi, lo + 1), n_days)
+
+    # Nhu cầu trung bình mỗi ngày trong window ngày gần nhất tính đến từng ngày (sản phẩm × ngày)
+    # Những ngày đầu chưa đủ window ngày thì chia cho số ngày đã có
+    def daily_demand(self, window=DEMAND_WINDOW_DAYS):
+        def compute():
+            cumulative = self.demand.cumulative
+            ends = np.arange(1, cumulative.shape[1])
+            starts = np.maximum(ends - max(int(window), 1), 0)
+            return (cumulative[:, ends] - cumulative[:, starts]) / (ends - starts)
+        return self._cache.get_or_compute(("demand", window), compute)
+
+    # Số ngày tồn kho đủ bán (sản phẩm × ngày): tồn cuối ngày / nhu cầu trung bình mỗi ngày
+    # Không có nhu cầu: vô hạn nếu còn hàng, 0 nếu hết hàng
+    def days_of_cover(self, window=DEMAND_WINDOW_DAYS, lo=0, hi=None):
+        levels = self.levels[:, lo:hi]
+        demand = self.daily_demand(window)[:, lo:hi]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cover = np.where(demand > 0, levels / demand, np.where(levels > 0, np.inf, 0.0))
+        return np.where(np.isnan(levels), np.nan, np.maximum(cover, 0.0))
+
+    # Bảng tóm tắt theo sản phẩm trong khoảng [start, end]: tồn kho và số ngày đủ bán ở ngày cuối,
+    # số ngày hết hàng (tồn ≤ 0), số ngày tồn dư (đủ bán > overstock_days ngày), ngày hết hàng đầu tiên
+    def summary(self, start=None, end=None, window=DEMAND_WINDOW_DAYS, overstock_days=OVERSTOCK_COVER_DAYS):
+        lo, hi = self._columns(start, end)
+        return self._cache.get_or_compute(("summary", lo, hi, window, overstock_days),
+                            lambda: self._summary(lo, hi, window, overstock_days))
+
+    def _summary(self, lo, hi, window, overstock_days):
+        levels = self.levels[:, lo:hi]
+        cover = self.days_of_cover(window, lo, hi)
+        stockout = levels <= 0
+        overstock = cover > overstock_days
+        first_stockout = self.dates[lo:hi][stockout.argmax(axis=1)]
+
+        result = pd.DataFrame({
+            "product_id": self.products["product_id"].to_numpy(),
+            "name": self.products["name"].to_numpy(),
+            "stock": levels[:, -1],
+            "days_of_cover": cover[:, -1],
+            "stockout_days": stockout.sum(axis=1),
+            "overstock_days": overstock.sum(axis=1),
+            "first_stockout": first_stockout.where(stockout.any(axis=1)),
+        })
+        result["stockout"] = result["stock"] <= 0
+        result["overstock"] = result["days_of_cover"] > overstock_days
+        return result
+
+    # Tồn kho theo ngày của một số sản phẩm (theo vị trí dòng): bảng ngày × tên sản phẩm
+    def history(self, positions, start=None, end=None):
+        lo, hi = self._columns(start, end)
+        positions = list(positions)
+        return pd.DataFrame(self.levels[positions, lo:hi].T, index=self.dates[lo:hi],
+                            columns=self.products["name"].to_numpy()[positions])
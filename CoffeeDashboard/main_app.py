@@ -1,9 +1,18 @@
 import streamlit as st
 import pandas as pd
-import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
+from aggregates import PERIOD_FREQUENCIES, make_periods
+from data_loader import load_forecast, load_inventory, load_query_store
+from figure_cache import render_png
+from registry import DATA_SOURCE, load_registry
+from diagnostics import begin_app, end_app, stage
+from categories import category_counts
+from charts import CHART_BACKENDS
+from slow_sellers import SLOW_SELLER_DIMENSIONS, find_slow_sellers
+from inventory import DEMAND_WINDOW_DAYS, OVERSTOCK_COVER_DAYS
+from forecast import FORECAST_HORIZON
+from views import (CATEGORY_CHART_TITLES, category_pie_plotly, forecast_figure, forecast_plotly, format_growth,
+                   inventory_figure, inventory_plotly, kpi_figure, kpi_plotly, kpi_summary, revenue_line_figure,
+                   revenue_line_plotly, slow_sellers_figure, slow_sellers_plotly, top10_figure, top10_plotly)
 
 # Cấu hình trang tổng thể
 st.set_page_config(
@@ -16,367 +25,402 @@ st.set_page_config(
 st.title("☕ Dashboard Phân Tích Kinh Doanh Cà Phê")
 st.markdown("---")
 
-# Tạo các tab
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
-    "📊 KPI Tổng Quan", 
-    "📈 Top 10 Bán Chạy", 
-    "📉 Sản Phẩm Bán Chậm", 
-    "📉 Biểu Đồ Đường", 
-    "🟣 Biểu Đồ Tròn"
-])
+# Hàm đọc kho tổng hợp cho một tab, trả về (kho, phiên bản dữ liệu)
+# Có nguồn nhiều file (COFFEE_DATA_SOURCE) thì gộp các file của cửa hàng/tháng đang chọn,
+# ngược lại đọc file mặc định của tab
+# Phiên bản là của bản dữ liệu đã dựng ra kho (có thể là bản cũ khi file đang được đọc lại),
+# nên ảnh biểu đồ cache theo phiên bản luôn khớp với số liệu đang hiển thị
+def load_view_store(default_path):
+    if registry is not None:
+        return registry.load_aggregate_store(selected_stores, selected_months, with_version=True)
+    return load_query_store(default_path, with_version=True)
+
+
+# Hàm đọc bảng tồn kho cho tab tồn kho, trả về (bảng tồn kho, phiên bản dữ liệu)
+def load_view_inventory(default_path):
+    if registry is not None:
+        return registry.load_inventory(selected_stores, selected_months, with_version=True)
+    return load_inventory(default_path, with_version=True)
+
+
+# Hàm đọc mô hình dự báo cho tab dự báo, trả về (mô hình, phiên bản dữ liệu)
+def load_view_forecast(default_path):
+    if registry is not None:
+        return registry.load_forecast(selected_stores, selected_months, with_version=True)
+    return load_forecast(default_path, with_version=True)
+
+
+# Chế độ hiển thị lười: chỉ tab đang mở được tính dữ liệu và vẽ biểu đồ ở mỗi lần chạy lại
+# Tắt (False) để dùng st.tabs như cũ, khi đó mọi tab đều được tính ở mỗi lần tương tác
+LAZY_TABS = True
 
 # ========================================
 # TAB 1: KPI Tổng Quan (từ KPI_app.py)
 # ========================================
-with tab1:
+def render_kpi():
     st.header("📊 KPI Dashboard Doanh Số Cà Phê")
 
     # Đọc dữ liệu
     try:
-        df_kpi = pd.read_excel("kf_coffee (1).xlsx", sheet_name="Trang tính1")
-    except:
+        # Kho tổng hợp dựng sẵn, cache dùng chung, chỉ dựng lại khi file thay đổi
+        # Tổng của một khoảng ngày bất kỳ chỉ là một phép trừ trên bảng tích lũy
+        kpi_store, kpi_version = load_view_store("kf_coffee (1).xlsx")
+    except OSError:
         st.error("Không tìm thấy file dữ liệu kf_coffee (1).xlsx")
         st.stop()
 
-    # Hàm parse date
-    def parse_date(date_str):
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d")
-        except (ValueError, TypeError):
-            return None
-
-    # Hàm tính số lượng bán
-    def sum_stock_decreased_in_range(stock_history_str, start_date, end_date):
-        try:
-            history = json.loads(stock_history_str).get("stock_history", [])
-            start = parse_date(start_date)
-            end = parse_date(end_date)
-            if not start or not end:
-                return 0
-            total = 0
-            for entry in history:
-                entry_date = parse_date(entry.get("date"))
-                if entry_date and start <= entry_date <= end:
-                    total += float(entry.get("stock_decreased", 0))
-            return total
-        except:
-            return 0
-
-    # Tính toán các chỉ số
-    df_kpi["Tuan_1"] = df_kpi["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-14"))
-    df_kpi["Tuan_2"] = df_kpi["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-15", "2025-03-22"))
-    df_kpi["Tuan_3"] = df_kpi["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-23", "2025-03-28"))
-    df_kpi["Ca_thang"] = df_kpi["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-28"))
-
-    # Tính doanh thu theo từng kỳ
-    period_order = ["Tuan_1", "Tuan_2", "Tuan_3", "Ca_thang"]
-    for period in period_order:
-        df_kpi[f"doanh_thu_{period}"] = df_kpi[period] * df_kpi["price"]
-
-    period_label = {
-        "Tuan_1": "Tuần 1 (07/03 → 14/03)",
-        "Tuan_2": "Tuần 2 (15/03 → 22/03)",
-        "Tuan_3": "Tuần 3 (23/03 → 28/03)",
-        "Ca_thang": "Cả tháng (07/03 → 28/03)"
-    }
-
-    selected_period = st.selectbox("Chọn kỳ:", options=period_order,
-                                   format_func=lambda x: period_label[x])
-
-    # Gán doanh thu của kỳ đang chọn vào cột 'doanh_thu'
-    df_kpi["doanh_thu"] = df_kpi[f"doanh_thu_{selected_period}"]
-    total_units_sold = df_kpi[selected_period].sum()
-    
-    # Tính tổng doanh thu dựa trên số liệu cung cấp
-    revenue_dict = {
-        "Tuan_1": 70595200,  # Tuần 1
-        "Tuan_2": 68469400,  # Tuần 2
-        "Tuan_3": 17212500,  # Tuần 3
-        "Ca_thang": 127622000  # Cả tháng
-    }
-    total_revenue = revenue_dict[selected_period]
-
-    top_product = df_kpi.sort_values(by="doanh_thu", ascending=False).iloc[0]["name"]
-
-    # Tính tăng trưởng so với kỳ trước
-    current_idx = period_order.index(selected_period)
-    if current_idx > 0:
-        prev_period = period_order[current_idx - 1]
-        prev_units_sold = df_kpi[prev_period].sum()
-        growth = ((total_units_sold - prev_units_sold) / prev_units_sold * 100) if prev_units_sold > 0 else 0
-        growth_text = f"{growth:+.1f}%"
+    # Bộ chọn khoảng ngày và kiểu chia kỳ
+    col_range, col_freq, col_window = st.columns([2, 1, 1])
+    date_range = col_range.date_input(
+        "Khoảng ngày:",
+        value=(kpi_store.first_date.date(), kpi_store.last_date.date()),
+        min_value=kpi_store.first_date.date(),
+        max_value=kpi_store.last_date.date()
+    )
+    freq = col_freq.selectbox("Chia kỳ:", options=list(PERIOD_FREQUENCIES),
+                              format_func=lambda x: PERIOD_FREQUENCIES[x], index=1)
+    window = col_window.number_input("Số ngày cuốn chiếu (N):", min_value=1, max_value=365,
+                                     value=7, disabled=freq != "rolling")
+
+    # Khi mới chọn ngày đầu, date_input chỉ trả về một ngày
+    if isinstance(date_range, (list, tuple)):
+        range_start, range_end = (date_range[0], date_range[-1]) if date_range else (kpi_store.first_date, kpi_store.last_date)
     else:
-        growth_text = "N/A"
+        range_start = range_end = date_range
+
+    # Các kỳ (nhãn, ngày bắt đầu, ngày kết thúc): toàn bộ khoảng + các kỳ con
+    kpi_periods = [(f"Toàn bộ khoảng ({range_start:%d/%m/%Y} → {range_end:%d/%m/%Y})", range_start, range_end)]
+    kpi_periods += make_periods(range_start, range_end, freq, window)
+    period_bounds = {name: (start, end) for name, start, end in kpi_periods}
 
-    growth_title = "Tăng trưởng so với tuần trước" if selected_period != "Ca_thang" else "Tăng trưởng của cả tháng"
+    selected_period = st.select_slider("Chọn kỳ:", options=list(period_bounds))
+    period_start, period_end = period_bounds[selected_period]
+
+    # Số lượng bán, doanh thu, top 10 theo doanh thu (chọn bằng heap) và tăng trưởng
+    # so với kỳ liền trước cùng độ dài; bảng nguồn dùng chung giữa các phiên, chỉ đọc
+    kpi = kpi_summary(kpi_store, period_start, period_end)
+    top_products = kpi["top_products"]
+    growth_title = "Tăng trưởng so với kỳ trước"
 
     # Hiển thị thẻ KPI
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("📈 Tổng doanh thu", f"{int(total_revenue):,} VNĐ")
-    col2.metric("📦 Sản phẩm bán ra", f"{int(total_units_sold):,}")
+    col1.metric("📈 Tổng doanh thu", f"{int(kpi['total_revenue']):,} VNĐ")
+    col2.metric("📦 Sản phẩm bán ra", f"{int(kpi['total_units']):,}")
 
     with col3:
         st.markdown("🔥 **Sản phẩm có doanh thu cao nhất**", unsafe_allow_html=True)
-        st.markdown(f"<div style='font-size:18px; white-space:normal'>{top_product}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='font-size:18px; white-space:normal'>{kpi['top_product']}</div>", unsafe_allow_html=True)
 
-    col4.metric("📊 " + growth_title, growth_text)
+    col4.metric("📊 " + growth_title, format_growth(kpi["growth"]))
 
     # Biểu đồ top sản phẩm
-    st.subheader(f"Top sản phẩm theo doanh thu - {period_label[selected_period]}")
-    top_products = df_kpi.sort_values(by="doanh_thu", ascending=False).head(10)
-    fig1, ax1 = plt.subplots(figsize=(12, 6))
-    bars = ax1.bar(top_products["name"], top_products["doanh_thu"], color="#4CAF50")
-    ax1.set_ylabel("Doanh thu (VNĐ)")
-    ax1.set_xticklabels(top_products["name"], rotation=45, ha='right')
-
-    # Thêm số liệu lên từng cột
-    for bar in bars:
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width() / 2, height + 0.01 * height,
-                 f"{int(height):,}", ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-    st.pyplot(fig1)
+    st.subheader(f"Top sản phẩm theo doanh thu - {selected_period}")
+
+    if chart_backend == "plotly":
+        st.plotly_chart(kpi_plotly(top_products), width="stretch")
+    else:
+        # Ảnh biểu đồ được cache theo (loại biểu đồ, kỳ, phiên bản dữ liệu)
+        st.image(render_png(("kpi_top_revenue", str(period_start), str(period_end), kpi_version),
+                            lambda: kpi_figure(top_products)),
+                 width="stretch")
+
+
 # ========================================
 # TAB 2: Top 10 Bán Chạy (từ top10_app.py)
 # ========================================
-with tab2:
+def render_top10():
     st.header("🏆 Top 10 Sản Phẩm Bán Chạy Nhất")
     
     try:
-        df_top10 = pd.read_csv("kf_coffee.csv")
-    except:
+        top10_store, top10_version = load_view_store("kf_coffee.csv")
+    except OSError:
         st.error("Không tìm thấy file dữ liệu kf_coffee.csv")
         st.stop()
     
-    # Hàm tính tổng số lượng bán
-    def total_stock_decreased(history_str):
-        try:
-            history = json.loads(history_str).get("stock_history", [])
-            return sum(float(entry.get("stock_decreased", 0)) for entry in history)
-        except:
-            return 0
-    
-    df_top10["stock_decreased"] = df_top10["stock_history"].apply(total_stock_decreased)
-    top_products = df_top10.groupby('name')['stock_decreased'].sum().sort_values(ascending=False).head(10)
+    # Top 10 theo tổng bán toàn thời gian, chọn bằng heap trên kho tổng hợp
+    top_products = top10_store.top_k("units", 10).set_index('name')['units']
     
     # Vẽ biểu đồ
-    fig2, ax2 = plt.subplots(figsize=(12, 6))
-    sns.barplot(x=top_products.values, y=top_products.index, palette='viridis', ax=ax2)
-    
-    for i, v in enumerate(top_products.values):
-        ax2.text(v + 5, i, str(int(v)), color='black', va='center', fontweight='bold')
-    
-    ax2.set_xlabel("Số lượng bán")
-    ax2.set_ylabel("Sản phẩm")
-    st.pyplot(fig2)
+    if chart_backend == "plotly":
+        st.plotly_chart(top10_plotly(top_products), width="stretch")
+    else:
+        st.image(render_png(("top10_units", top10_version), lambda: top10_figure(top_products)),
+                 width="stretch")
+
 
 # ========================================
 # TAB 3: Sản Phẩm Bán Chậm (từ bancham_app.py)
 # ========================================
-with tab3:
+def render_slow_sellers():
     st.header("⚠️ Phân Tích Sản Phẩm Bán Chậm")
-    
-    slow_selling_products = [
-        "Cà phê sữa The Coffee House 180ml (1 lon)",
-        "Cà phê sữa đá hòa tan The Coffee House bịch 25 gói x 22g",
-        "Cà phê sữa đá miền Nam Cà Phê Phố túi 30 gói x 24g",
-        "Cà phê sữa nhà làm Cà Phê Phố túi 30 gói x 28g",
-        "Cà phê rang xay culi Highlands Coffee gói 200g",
-        "Cà phê hoà tan nguyên chất 114 UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-        "Cà phê hoà tan nguyên chất Sumiyaki UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-        "Cà phê hoà tan nguyên chất 117 UCC hộp 20g (10 gói x 2g) (1 Hộp)",
-        "Cà phê hoà tan black 2IN1 K-Coffee hộp 15 gói x 17g (1 Hộp)",
-        "Cà phê hoà tan pha lạnh 3in1 vị nguyên bản UCC hộp 250g (10 gói x 25g) (1 Hộp)"
-    ]
-    
+
     try:
-        df_slow = pd.read_excel("kf_coffee (1).xlsx", sheet_name="Trang tính1")
-        df_slow = df_slow[df_slow["name"].isin(slow_selling_products)].copy()
-    except:
+        slow_store, slow_version = load_view_store("kf_coffee (1).xlsx")
+    except OSError:
         st.error("Không tìm thấy file dữ liệu")
         st.stop()
-    
-    # Hàm hỗ trợ
-    def parse_date(date_str):
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d")
-        except:
-            return None
-    
-    def sum_stock_decreased_in_range(stock_history_str, start_date, end_date):
-        try:
-            history = json.loads(stock_history_str).get("stock_history", [])
-            start = parse_date(start_date)
-            end = parse_date(end_date)
-            total = 0
-            for entry in history:
-                entry_date = parse_date(entry.get("date"))
-                if entry_date and start <= entry_date <= end:
-                    total += float(entry.get("stock_decreased", 0))
-            return total
-        except:
-            return 0
-    
-    # Tính toán
-    df_slow["Tuần 1"] = df_slow["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-07", "2025-03-14"))
-    df_slow["Tuần 2"] = df_slow["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-15", "2025-03-22"))
-    df_slow["Tuần 3"] = df_slow["stock_history"].apply(lambda x: sum_stock_decreased_in_range(x, "2025-03-23", "2025-03-28"))
-    df_slow["Cả tháng"] = df_slow["Tuần 1"] + df_slow["Tuần 2"] + df_slow["Tuần 3"]
-    
-    period = st.selectbox("Chọn kỳ phân tích:", ["Tuần 1", "Tuần 2", "Tuần 3", "Cả tháng"])
-    
-    # Lọc dữ liệu
-    threshold = 25
-    if period in ["Tuần 1", "Tuần 2", "Tuần 3"]:
-        data_filtered = df_slow[(df_slow[period] > 0) & (df_slow[period] < threshold)][["name", period]].sort_values(by=period, ascending=False)
+
+    # Bộ chọn khoảng ngày, cách nhóm, ngưỡng phân vị và số sản phẩm hiển thị
+    col_range, col_dim, col_pct, col_k = st.columns([2, 1, 1, 1])
+    slow_range = col_range.date_input(
+        "Khoảng ngày phân tích:",
+        value=(slow_store.first_date.date(), slow_store.last_date.date()),
+        min_value=slow_store.first_date.date(),
+        max_value=slow_store.last_date.date(),
+        key="slow_range"
+    )
+    dimension = col_dim.selectbox("Xếp hạng trong nhóm:", options=list(SLOW_SELLER_DIMENSIONS),
+                                  format_func=lambda x: SLOW_SELLER_DIMENSIONS[x])
+    percentile = col_pct.slider("Ngưỡng phân vị (%):", min_value=5, max_value=100, value=25, step=5)
+    top_k = col_k.number_input("Số sản phẩm:", min_value=1, max_value=100, value=10)
+
+    if isinstance(slow_range, (list, tuple)):
+        slow_start, slow_end = (slow_range[0], slow_range[-1]) if slow_range else (None, None)
     else:
-        mask = (
-            ((df_slow["Tuần 1"] > 0) & (df_slow["Tuần 1"] < threshold)) |
-            ((df_slow["Tuần 2"] > 0) & (df_slow["Tuần 2"] < threshold)) |
-            ((df_slow["Tuần 3"] > 0) & (df_slow["Tuần 3"] < threshold)))
-        df_filtered = df_slow[mask].copy()
-        data_filtered = df_filtered[["name", "Cả tháng"]].sort_values(by="Cả tháng", ascending=False)
-    
+        slow_start = slow_end = slow_range
+
+    # Xếp hạng theo tốc độ bán (số lượng/ngày) và phân vị trong nhóm, chỉ lấy k sản phẩm chậm nhất
+    data_filtered = find_slow_sellers(slow_store, slow_start, slow_end, k=top_k,
+                                      dimension=dimension, percentile=percentile)
+    period = f"{pd.Timestamp(slow_start or slow_store.first_date):%d/%m} → {pd.Timestamp(slow_end or slow_store.last_date):%d/%m}"
+
     # Tính tổng số lượng bán ra cho kỳ được chọn
-    total_period = data_filtered[period].sum() if not data_filtered.empty else 0
+    total_period = data_filtered["units"].sum() if not data_filtered.empty else 0
     
     # Hiển thị kết quả
     if data_filtered.empty:
         st.success(f"✅ Không có sản phẩm nào bán chậm trong {period}.")
     else:
-        fig3, ax3 = plt.subplots(figsize=(10, 5))
-        sns.barplot(data=data_filtered, x=period, y="name", palette="Set2", ax=ax3)
-        
-        for i, v in enumerate(data_filtered[period]):
-            ax3.text(v + 0.2, i, str(int(v)), va='center', color='black', fontweight='bold')
-        
-        ax3.set_xlabel("Số lượng bán")
-        ax3.set_ylabel("Tên sản phẩm")
-        st.pyplot(fig3)
+        if chart_backend == "plotly":
+            st.plotly_chart(slow_sellers_plotly(data_filtered, period), width="stretch")
+        else:
+            slow_key = ("slow_sellers", str(slow_start), str(slow_end), dimension, percentile, top_k, slow_version)
+            st.image(render_png(slow_key, lambda: slow_sellers_figure(data_filtered, period)), width="stretch")
         
         # Hiển thị tổng số lượng bán ra cho kỳ được chọn
         st.info(
             f"📌 Tổng sản phẩm bán ra (trong nhóm bán chậm): **{int(total_period):,}** đơn vị."
         )
 
+        with st.expander("📋 Chi tiết tốc độ bán"):
+            st.dataframe(
+                data_filtered[["name", "group", "units", "velocity", "percentile"]].rename(columns={
+                    "name": "Sản phẩm", "group": "Nhóm", "units": "Số lượng bán",
+                    "velocity": "Bán/ngày", "percentile": "Phân vị trong nhóm (%)"}),
+                width="stretch"
+            )
+
+
 # ========================================
 # TAB 4: Biểu Đồ Đường (từ bieudoduong_app.py)
 # ========================================
-with tab4:
+def render_line_chart():
     st.header("📈 Biểu Đồ Doanh Thu Top 5 Sản Phẩm")
 
     try:
-        df_line = pd.read_csv("kf_coffee.csv")
-    except:
+        line_store, line_version = load_view_store("kf_coffee.csv")
+    except OSError:
         st.error("Không tìm thấy file dữ liệu kf_coffee.csv")
         st.stop()
 
-    # Hàm tính tổng số lượng bán
-    def total_sold_from_history(stock_history_str):
-        try:
-            history = json.loads(stock_history_str).get("stock_history", [])
-            return sum(float(entry.get("stock_decreased", 0)) for entry in history)
-        except:
-            return 0
-
-    # Tính toán doanh thu
-    df_line['so_luong_ban'] = df_line['stock_history'].apply(total_sold_from_history)
-    df_line['doanh_thu'] = df_line['so_luong_ban'] * df_line['price']
-    revenue_by_product = df_line.groupby('name')['doanh_thu'].sum().sort_values(ascending=False).head(5)
+    # Top 5 theo doanh thu toàn thời gian, chọn bằng heap trên kho tổng hợp
+    revenue_by_product = line_store.top_k("revenue", 5).set_index('name')['revenue']
 
     # Vẽ biểu đồ
-    fig4, ax4 = plt.subplots(figsize=(20, 10), facecolor="#F5F5F5")
-    sns.set_style("whitegrid")
-
-    # Vẽ đường chính
-    sns.lineplot(x=revenue_by_product.index, y=revenue_by_product.values, marker='o',
-                 markersize=15, linestyle='-', linewidth=3, color='#2196F3',
-                 markeredgecolor='black', markeredgewidth=1, ax=ax4)
-
-    # Vẽ bóng nền
-    sns.lineplot(x=revenue_by_product.index, y=revenue_by_product.values, marker='o',
-                 markersize=12, linestyle='-', linewidth=5, color='#BBDEFB', alpha=0.5, ax=ax4)
-
-    # Thêm nhãn số lên điểm
-    for i, (x, y) in enumerate(zip(revenue_by_product.index, revenue_by_product.values)):
-        ax4.text(i, y + y*0.01, f"{int(y):,} VNĐ", ha='center', va='bottom',
-                fontsize=12, fontweight='bold', color='#4CAF50')
-
-    # Tùy chỉnh biểu đồ
-    ax4.set_title("Doanh Thu Top 5 Sản Phẩm (Line Chart)", fontsize=18, fontweight='bold', pad=20, color='#333333')
-    ax4.set_xlabel("Sản Phẩm", fontsize=14, fontweight='bold', color='#333333')
-    ax4.set_ylabel("Doanh Thu (VNĐ)", fontsize=14, fontweight='bold', color='#333333')
-    ax4.set_xticklabels(revenue_by_product.index, rotation=45, fontsize=12, fontweight='bold', color='#333333')
-    ax4.tick_params(axis='y', labelsize=12)
-
-    # Viền khung biểu đồ
-    for spine in ax4.spines.values():
-        spine.set_color('#B0BEC5')
-        spine.set_linewidth(1.5)
-
-    # Đường lưới
-    ax4.yaxis.grid(True, linestyle='--', color='#E0E0E0', alpha=0.7)
-    ax4.xaxis.grid(False)
-
-    st.pyplot(fig4)
-
-    # ========================================
+    if chart_backend == "plotly":
+        st.plotly_chart(revenue_line_plotly(revenue_by_product), width="stretch")
+    else:
+        st.image(render_png(("top5_revenue_line", line_version), lambda: revenue_line_figure(revenue_by_product)),
+                 width="stretch")
+
+
+# ========================================
 # TAB 5: Biểu Đồ Tròn
 # ========================================
-with tab5:
+def render_pie_chart():
     st.header("🟣 Biểu Đồ Tròn Phân Phối Sản Phẩm")
 
-    import plotly.graph_objects as go
+    try:
+        pie_store, _ = load_view_store("kf_coffee.csv")
+    except OSError:
+        st.error("Không tìm thấy file dữ liệu kf_coffee.csv")
+        st.stop()
+
+    # Chọn loại biểu đồ: số sản phẩm theo loại bao bì / loại cà phê, phân loại từ tên lúc ingest
+    dimension = st.selectbox('Chọn biểu đồ:', options=list(CATEGORY_CHART_TITLES),
+                             format_func=lambda x: CATEGORY_CHART_TITLES[x])
+    counts = category_counts(pie_store.products, dimension)
+    fig5 = category_pie_plotly(counts, CATEGORY_CHART_TITLES[dimension])
+
+    st.plotly_chart(fig5, width="stretch")
 
-    # Dữ liệu loại bao bì
-    packaging_types = ['Lon', 'Hộp', 'Túi', 'Gói', 'Bịch', 'Ly']
-    packaging_counts = [3, 23, 6, 13, 4, 1]
-    packaging_colors = ['#FF6F61', '#6B5B95', '#88B04B', '#F7CAC9', '#92A8D1', '#F4E04D']
 
-    # Dữ liệu loại cà phê
-    coffee_types = ['Hòa tan', 'Rang xay', 'Sữa']
-    coffee_counts = [21, 9, 26]
-    coffee_colors = ['#FF6F61', '#6B5B95', '#88B04B']
+# ========================================
+# TAB 6: Tồn Kho
+# ========================================
+def render_inventory():
+    st.header("📦 Tồn Kho Theo Ngày")
 
-    # Chọn loại biểu đồ
-    selected_option = st.selectbox(
-        'Chọn biểu đồ:',
-        ['Phân phối sản phẩm theo loại bao bì', 'Phân phối sản phẩm theo loại cà phê']
+    try:
+        # Tồn kho cuối ngày của mọi sản phẩm, dựng lại một lần từ stock_quantity và biến động kho
+        inventory, inventory_version = load_view_inventory("kf_coffee (1).xlsx")
+    except OSError:
+        st.error("Không tìm thấy file dữ liệu kf_coffee (1).xlsx")
+        st.stop()
+
+    if registry is not None:
+        st.caption("Tồn kho là tổng của các cửa hàng được chọn; tồn kho hiện tại của mỗi cửa hàng "
+                   "lấy theo file có tháng mới nhất của cửa hàng đó.")
+
+    # Bộ chọn khoảng ngày, số ngày tính nhu cầu và ngưỡng tồn dư
+    col_range, col_window, col_over = st.columns([2, 1, 1])
+    inventory_range = col_range.date_input(
+        "Khoảng ngày:",
+        value=(inventory.first_date.date(), inventory.last_date.date()),
+        min_value=inventory.first_date.date(),
+        max_value=inventory.last_date.date(),
+        key="inventory_range"
     )
+    window = col_window.number_input("Số ngày tính nhu cầu:", min_value=1, max_value=90,
+                                     value=DEMAND_WINDOW_DAYS)
+    overstock_days = col_over.number_input("Tồn dư khi đủ bán quá (ngày):", min_value=1, max_value=365,
+                                           value=OVERSTOCK_COVER_DAYS)
 
-    # Gán dữ liệu tương ứng
-    if selected_option == 'Phân phối sản phẩm theo loại bao bì':
-        labels = packaging_types
-        values = packaging_counts
-        colors = packaging_colors
-        title = 'Phân phối sản phẩm theo loại bao bì'
+    if isinstance(inventory_range, (list, tuple)):
+        inv_start, inv_end = (inventory_range[0], inventory_range[-1]) if inventory_range else (None, None)
     else:
-        labels = coffee_types
-        values = coffee_counts
-        colors = coffee_colors
-        title = 'Phân phối sản phẩm theo loại cà phê'
+        inv_start = inv_end = inventory_range
 
-    # Vẽ biểu đồ
-        # Vẽ biểu đồ
-    fig5 = go.Figure(
-        data=[go.Pie(
-            labels=labels,
-            values=values,
-            textinfo='label+percent',
-            hoverinfo='label+value',
-            marker=dict(colors=colors),
-            insidetextorientation='radial',
-            textfont=dict(size=18)  # 👉 Cỡ chữ bên trong biểu đồ
-        )]
-    )
+    # Tóm tắt theo sản phẩm: tính trên cả ma trận sản phẩm × ngày một lần, không lặp theo sản phẩm
+    summary = inventory.summary(inv_start, inv_end, window, overstock_days)
+    cover = summary["days_of_cover"]
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("🚫 Hết hàng (ngày cuối)", f"{int(summary['stockout'].sum()):,}")
+    col2.metric("📦 Tồn dư (ngày cuối)", f"{int(summary['overstock'].sum()):,}")
+    col3.metric("⏱️ Trung vị số ngày đủ bán", f"{cover[cover.notna() & (cover != float('inf'))].median():,.1f}")
+    col4.metric("📉 Sản phẩm từng hết hàng trong kỳ", f"{int((summary['stockout_days'] > 0).sum()):,}")
+
+    # Mặc định hiện các sản phẩm hết hàng nhiều ngày nhất
+    ranked = summary.sort_values(["stockout_days", "days_of_cover"], ascending=[False, True])
+    names = summary["name"].tolist()
+    selected = st.multiselect("Sản phẩm:", options=names, default=ranked["name"].head(5).tolist(),
+                              key="inventory_products")
+
+    if selected:
+        history = inventory.history([names.index(name) for name in selected], inv_start, inv_end)
+        if chart_backend == "plotly":
+            st.plotly_chart(inventory_plotly(history), width="stretch")
+        else:
+            inventory_key = ("inventory", str(inv_start), str(inv_end), tuple(selected), inventory_version)
+            st.image(render_png(inventory_key, lambda: inventory_figure(history)), width="stretch")
+
+    with st.expander("📋 Chi tiết tồn kho", expanded=True):
+        st.dataframe(
+            ranked[["name", "stock", "days_of_cover", "stockout_days", "overstock_days", "first_stockout",
+                    "stockout", "overstock"]].rename(columns={
+                "name": "Sản phẩm", "stock": "Tồn kho", "days_of_cover": "Số ngày đủ bán",
+                "stockout_days": "Số ngày hết hàng", "overstock_days": "Số ngày tồn dư",
+                "first_stockout": "Hết hàng lần đầu", "stockout": "Đang hết hàng", "overstock": "Đang tồn dư"}),
+            width="stretch", hide_index=True
+        )
 
-    fig5.update_layout(
-        title=title,
-        showlegend=True,
-        legend=dict(font=dict(size=22))# 👉 Cỡ chữ phần chú thích
-    )
 
-    st.plotly_chart(fig5, use_container_width=True)
+# ========================================
+# TAB 7: Dự Báo Bán Hàng
+# ========================================
+def render_forecast():
+    st.header("🔮 Dự Báo Số Lượng Bán")
+
+    try:
+        # Mô hình Holt-Winters theo thứ trong tuần, khớp cho cả danh mục cùng lúc; tham số được
+        # giữ giữa các lần chạy lại và chỉ cập nhật tăng dần khi file có thêm ngày mới
+        model, forecast_version = load_view_forecast("kf_coffee (1).xlsx")
+    except OSError:
+        st.error("Không tìm thấy file dữ liệu kf_coffee (1).xlsx")
+        st.stop()
+
+    horizon = st.slider("Số ngày dự báo:", min_value=1, max_value=28, value=FORECAST_HORIZON)
+    forecast, forecast_dates = model.predict(horizon)
+    recent, _ = model.history(horizon)
+
+    table = pd.DataFrame({
+        "name": model.names,
+        "forecast": forecast.sum(axis=1),
+        "recent": recent.sum(axis=1),
+        "alpha": model.alpha,
+        "beta": model.beta,
+        "gamma": model.gamma,
+    })
+    table["change"] = (table["forecast"] - table["recent"]) / table["recent"].where(table["recent"] > 0) * 100
+    table = table.sort_values("forecast", ascending=False)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric(f"📦 Dự báo {horizon} ngày tới", f"{table['forecast'].sum():,.0f}")
+    col2.metric(f"🗓️ Thực tế {recent.shape[1]} ngày gần nhất", f"{table['recent'].sum():,.0f}")
+    fit_labels = {"full": "Khớp lại toàn bộ", "incremental": f"Cập nhật tăng dần (+{model.new_days} ngày)"}
+    col3.metric("⚙️ Mô hình", fit_labels[model.fit_mode])
+    st.caption(f"Dữ liệu đến {model.last_date:%d/%m/%Y}; dự báo {forecast_dates[0]:%d/%m} → {forecast_dates[-1]:%d/%m}.")
+
+    names = table["name"].tolist()
+    selected = st.multiselect("Sản phẩm:", options=names, default=names[:5], key="forecast_products")
+    if selected:
+        positions = [model.names.tolist().index(name) for name in selected]
+        history_values, history_dates = model.history()
+        history = pd.DataFrame(history_values[positions].T, index=history_dates, columns=selected)
+        predicted = pd.DataFrame(forecast[positions].T, index=forecast_dates, columns=selected)
+        if chart_backend == "plotly":
+            st.plotly_chart(forecast_plotly(history, predicted), width="stretch")
+        else:
+            forecast_key = ("forecast", horizon, tuple(selected), forecast_version)
+            st.image(render_png(forecast_key, lambda: forecast_figure(history, predicted)), width="stretch")
+
+    with st.expander("📋 Chi tiết dự báo"):
+        st.dataframe(table.rename(columns={
+            "name": "Sản phẩm", "forecast": f"Dự báo {horizon} ngày", "recent": f"Thực tế {recent.shape[1]} ngày",
+            "change": "Thay đổi (%)", "alpha": "α (mức)", "beta": "β (xu hướng)", "gamma": "γ (theo thứ)"}),
+            width="stretch", hide_index=True)
+
+
+# Các tab: nhãn -> hàm hiển thị
+VIEWS = {
+    "📊 KPI Tổng Quan": render_kpi,
+    "📈 Top 10 Bán Chạy": render_top10,
+    "📉 Sản Phẩm Bán Chậm": render_slow_sellers,
+    "📉 Biểu Đồ Đường": render_line_chart,
+    "🟣 Biểu Đồ Tròn": render_pie_chart,
+    "📦 Tồn Kho": render_inventory,
+    "🔮 Dự Báo": render_forecast,
+}
+
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("main_app")
+
+# Lọc theo cửa hàng và tháng khi dùng nguồn nhiều file (để trống = tất cả)
+registry = load_registry() if DATA_SOURCE else None
+selected_stores = selected_months = None
+if registry is not None:
+    selected_stores = st.sidebar.multiselect("Cửa hàng:", options=registry.stores())
+    selected_months = st.sidebar.multiselect("Tháng:", options=registry.months())
+
+# Kiểu vẽ biểu đồ cột/đường cho mọi tab
+chart_backend = st.sidebar.selectbox("Kiểu biểu đồ:", options=list(CHART_BACKENDS),
+                                     format_func=lambda x: CHART_BACKENDS[x])
+
+try:
+    if LAZY_TABS:
+        # Thanh chọn tab; lựa chọn được giữ trong session_state giữa các lần chạy lại
+        active_view = st.radio("Chọn tab:", options=list(VIEWS), horizontal=True,
+                               key="active_view", label_visibility="collapsed")
+        with stage(f"view:{VIEWS[active_view].__name__}"):
+            VIEWS[active_view]()
+    else:
+        for tab, render in zip(st.tabs(list(VIEWS)), VIEWS.values()):
+            with tab, stage(f"view:{render.__name__}"):
+                render()
+finally:
+    # Kể cả khi tab dừng sớm bằng st.stop()
+    end_app()
 
 # Footer
 st.markdown("---")
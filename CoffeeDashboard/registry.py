@@ -0,0 +1,207 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateStore
+from data_loader import file_signature, load_derived, to_memory_layout
+from diagnostics import instrument
+from forecast import fit_forecast
+from inventory import InventoryLevels
+
+# Nguồn dữ liệu nhiều file: thư mục hoặc mẫu glob, ví dụ "exports/*/*.csv"
+# Không đặt thì các app dùng một file như trước
+DATA_SOURCE = os.environ.get("COFFEE_DATA_SOURCE")
+
+# Phần mở rộng của file xuất được nhận
+SOURCE_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+# Tháng trong tên file, ví dụ "quan1_2025-03.csv" hoặc "2025_03.xlsx"
+MONTH_PATTERN = re.compile(r"(\d{4})[-_.](\d{2})")
+
+# Nhãn cho phân vùng không rõ tháng
+UNKNOWN_MONTH = "Không rõ"
+
+# Số luồng đọc các phân vùng song song
+LOAD_WORKERS = 4
+
+# Số kho tổng hợp / bảng tồn kho (theo từng lựa chọn cửa hàng/tháng) giữ lại trong bộ nhớ
+REGISTRY_CACHE_SIZE = 8
+
+
+# Hàm tách cửa hàng và tháng từ đường dẫn của một file xuất
+# Tháng lấy từ tên file; cửa hàng là phần còn lại của tên file, nếu rỗng thì lấy tên thư mục cha
+def partition_info(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = MONTH_PATTERN.search(stem)
+    month = f"{match.group(1)}-{match.group(2)}" if match else UNKNOWN_MONTH
+    store = (MONTH_PATTERN.sub("", stem) if match else stem).strip(" _-.")
+    if not store:
+        store = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return store, month
+
+
+# Hàm liệt kê các file xuất của nguồn (thư mục thì quét đệ quy, còn lại coi là mẫu glob)
+def discover_partitions(source):
+    if os.path.isdir(source):
+        paths = [os.path.join(root, name) for root, _, files in os.walk(source) for name in files]
+    else:
+        paths = glob.glob(source, recursive=True)
+    paths = sorted(os.path.abspath(p) for p in paths if p.lower().endswith(SOURCE_EXTENSIONS))
+    rows = [(path, *partition_info(path)) for path in paths]
+    return pd.DataFrame(rows, columns=["path", "store", "month"])
+
+
+# Hàm tính phiên bản của một nhóm phân vùng từ chữ ký file của từng phân vùng
+def partitions_version(paths, signatures):
+    lines = [f"{path}:{signature}" for path, signature in zip(paths, signatures)]
+    return hashlib.sha1("\n".join(lines).encode()).hexdigest()
+
+
+# Hàm gộp các phân vùng thành một bộ (products, movements)
+# Sản phẩm trùng tên giữa các file là một sản phẩm; thuộc tính (giá, phân loại) lấy theo
+# phân vùng có tháng mới nhất. Tồn kho hiện tại (stock_quantity) là tổng tồn kho của các cửa hàng,
+# mỗi cửa hàng lấy theo phân vùng có tháng mới nhất của cửa hàng đó, để khớp với biến động được
+# cộng chung mọi cửa hàng. Biến động giữ thêm cột store
+def combine_partitions(partitions, datasets):
+    frames = []
+    for store, month, (products, _) in zip(partitions["store"], partitions["month"], datasets):
+        frames.append(products.assign(_store=store, _month=month))
+    all_products = pd.concat(frames, ignore_index=True)
+
+    names = pd.Index(pd.unique(all_products["name"]), name="name")
+    months = all_products["_month"].where(all_products["_month"] != UNKNOWN_MONTH, "")
+    ordered = all_products.iloc[np.argsort(months.to_numpy(), kind="stable")]
+    latest = ordered.drop_duplicates("name", keep="last")
+    products = latest.set_index("name").reindex(names).reset_index()[frames[0].columns.drop(["_store", "_month"])]
+    products["product_id"] = np.arange(len(products), dtype=np.int64)
+    if "stock_quantity" in products:
+        # Cửa hàng có sản phẩm nhưng thiếu tồn kho thì tổng cũng không rõ (NaN)
+        store_latest = ordered.drop_duplicates(["name", "_store"], keep="last")
+        stock = pd.to_numeric(store_latest["stock_quantity"], errors="coerce").astype(np.float64)
+        keys = store_latest["name"].to_numpy()
+        total = stock.groupby(keys).sum().where(~stock.isna().groupby(keys).any())
+        products["stock_quantity"] = total.reindex(names).to_numpy()
+
+    parts = []
+    for store, (part_products, part_movements) in zip(partitions["store"], datasets):
+        local_names = pd.Series(part_products["name"].to_numpy(), index=part_products["product_id"].to_numpy())
+        local_names = local_names[~local_names.index.duplicated()]
+        ids = names.get_indexer(local_names.reindex(part_movements["product_id"].to_numpy()))
+        parts.append(part_movements.assign(product_id=ids.astype(np.int64), store=store)[ids >= 0])
+    movements = pd.concat(parts, ignore_index=True)
+    return to_memory_layout(products, movements)
+
+
+# Danh mục dữ liệu nhiều file: mỗi file xuất là một phân vùng (cửa hàng, tháng)
+# Chỉ các phân vùng được chọn mới được đọc, mỗi file được cache riêng (kèm cache Parquet)
+# nên đổi lựa chọn không phải đọc lại các file đã đọc
+class DatasetRegistry:
+    def __init__(self, source):
+        self.source = source
+        self.partitions = discover_partitions(source)
+        self._stores = OrderedDict()
+        # Mô hình dự báo gần nhất của từng lựa chọn cửa hàng/tháng, để cập nhật tăng dần
+        self._forecasts = {}
+        self._lock = threading.Lock()
+
+    # Hàm quét lại nguồn để nhận file xuất mới
+    def refresh(self):
+        self.partitions = discover_partitions(self.source)
+
+    # Danh sách cửa hàng và tháng có trong nguồn
+    def stores(self):
+        return sorted(self.partitions["store"].unique())
+
+    def months(self):
+        return sorted(self.partitions["month"].unique())
+
+    # Hàm chọn các phân vùng theo cửa hàng và tháng (None hoặc rỗng = tất cả)
+    def select(self, stores=None, months=None):
+        mask = np.ones(len(self.partitions), dtype=bool)
+        if stores:
+            mask &= self.partitions["store"].isin(stores).to_numpy()
+        if months:
+            mask &= self.partitions["month"].isin(months).to_numpy()
+        return self.partitions[mask].reset_index(drop=True)
+
+    # Phiên bản dữ liệu của một lựa chọn: đổi khi có file được thêm, bớt hoặc sửa
+    def version(self, stores=None, months=None):
+        paths = self.select(stores, months)["path"]
+        return partitions_version(paths, [file_signature(path) for path in paths])
+
+    # Hàm đọc song song các phân vùng được chọn rồi gộp lại
+    # with_version=True: trả về (dữ liệu, phiên bản tính từ chữ ký của các bản file đã đọc)
+    @instrument("registry_load")
+    def load_dataset(self, stores=None, months=None, with_version=False):
+        partitions = self.select(stores, months)
+        if partitions.empty:
+            raise FileNotFoundError(f"Không có file dữ liệu nào khớp với {self.source}")
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            loaded = list(pool.map(lambda path: load_derived(path, "dataset", lambda p, m: (p, m), True),
+                                   partitions["path"]))
+        dataset = combine_partitions(partitions, [data for data, _ in loaded])
+        if with_version:
+            return dataset, partitions_version(partitions["path"], [signature for _, signature in loaded])
+        return dataset
+
+    # Hàm đọc kho tổng hợp của một lựa chọn cửa hàng/tháng (cache theo phiên bản dữ liệu)
+    def load_aggregate_store(self, stores=None, months=None, with_version=False):
+        return self._load_derived("aggregate_store", AggregateStore, stores, months, with_version)
+
+    # Hàm đọc bảng tồn kho của một lựa chọn cửa hàng/tháng; biến động và tồn kho hiện tại của
+    # các cửa hàng được cộng chung (xem combine_partitions)
+    def load_inventory(self, stores=None, months=None, with_version=False):
+        return self._load_derived("inventory", InventoryLevels, stores, months, with_version)
+
+    # Hàm đọc mô hình dự báo của một lựa chọn cửa hàng/tháng
+    def load_forecast(self, stores=None, months=None, with_version=False):
+        selection = (tuple(sorted(stores or [])), tuple(sorted(months or [])))
+
+        def build(products, movements):
+            with self._lock:
+                previous = self._forecasts.get(selection)
+            model = fit_forecast(products, movements, previous)
+            with self._lock:
+                self._forecasts[selection] = model
+            return model
+        return self._load_derived("forecast", build, stores, months, with_version)
+
+    # Cache theo (tên, phiên bản); bảng dựng từ bản file cũ (khi file đang được đọc lại) được lưu
+    # theo phiên bản của bản cũ đó, không theo phiên bản hiện tại
+    def _load_derived(self, name, builder, stores, months, with_version=False):
+        version = self.version(stores, months)
+        with self._lock:
+            store = self._stores.get((name, version))
+            if store is not None:
+                self._stores.move_to_end((name, version))
+        if store is None:
+            dataset, version = self.load_dataset(stores, months, with_version=True)
+            store = builder(*dataset).freeze()
+            with self._lock:
+                self._stores[(name, version)] = store
+                while len(self._stores) > REGISTRY_CACHE_SIZE:
+                    self._stores.popitem(last=False)
+        return (store, version) if with_version else store
+
+
+# Danh mục theo nguồn, dùng chung trong tiến trình
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+# Hàm lấy danh mục của một nguồn (quét lại file mỗi lần gọi để nhận file mới)
+def load_registry(source=None):
+    source = source or DATA_SOURCE
+    with _registries_lock:
+        if source not in _registries:
+            _registries[source] = DatasetRegistry(source)
+        else:
+            _registries[source].refresh()
+        return _registries[source]
@@ -0,0 +1,199 @@
+import argparse
+import html
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from aggregates import AggregateStore, make_periods
+from categories import category_counts
+from data_loader import ingest_file
+from slow_sellers import find_slow_sellers
+from views import (CATEGORY_CHART_TITLES, category_pie_figure, category_pie_plotly, format_growth, kpi_figure,
+                   kpi_plotly, kpi_summary, revenue_line_figure, revenue_line_plotly, slow_sellers_figure,
+                   slow_sellers_plotly, top10_figure, top10_plotly)
+
+# Các định dạng xuất: ảnh PNG (matplotlib) và HTML tương tác (Plotly)
+REPORT_FORMATS = ["png", "html"]
+
+# Các biểu đồ vẽ cho từng kỳ
+PERIOD_VIEWS = ["kpi", "top10", "slow_sellers", "revenue_line"]
+
+# Tùy chọn lưu ảnh PNG, giống mặc định của st.pyplot
+PNG_OPTIONS = {"dpi": 200, "bbox_inches": "tight"}
+
+# Kho tổng hợp của tiến trình con, nhận một lần qua initializer của pool
+_store = None
+
+
+def _init_worker(store):
+    global _store
+    _store = store
+
+
+# Hàm đổi tên kỳ thành tên thư mục
+def slugify(name):
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", name).strip("_") or "period"
+
+
+# Hàm ghi một biểu đồ ra các định dạng được chọn; trả về danh sách file đã ghi
+def write_chart(path, formats, draw_png, draw_html):
+    written = []
+    if "png" in formats:
+        fig = draw_png()
+        try:
+            fig.savefig(path + ".png", **PNG_OPTIONS)
+        finally:
+            plt.close(fig)
+        written.append(path + ".png")
+    if "html" in formats:
+        draw_html().write_html(path + ".html", include_plotlyjs="cdn")
+        written.append(path + ".html")
+    return written
+
+
+# Hàm vẽ một biểu đồ (chạy trong tiến trình con, đọc từ kho tổng hợp dùng chung)
+# task: (biểu đồ, tên kỳ, ngày bắt đầu, ngày kết thúc, thư mục đích, định dạng)
+# Trả về (biểu đồ, tên kỳ, danh sách file, số liệu tóm tắt)
+def render_task(task):
+    view, name, start, end, out_dir, formats = task
+    path = os.path.join(out_dir, view)
+    summary = {}
+
+    if view == "kpi":
+        kpi = kpi_summary(_store, start, end)
+        top_products = kpi.pop("top_products")
+        summary = kpi
+        files = write_chart(path, formats, lambda: kpi_figure(top_products), lambda: kpi_plotly(top_products))
+    elif view == "top10":
+        top_products = _store.top_k("units", 10, (start, end)).set_index("name")["units"]
+        files = write_chart(path, formats, lambda: top10_figure(top_products), lambda: top10_plotly(top_products))
+    elif view == "slow_sellers":
+        data = find_slow_sellers(_store, start, end, k=10)
+        label = f"{pd.Timestamp(start):%d/%m} → {pd.Timestamp(end):%d/%m}"
+        summary = {"slow_sellers": len(data), "slow_units": float(data["units"].sum())}
+        files = [] if data.empty else write_chart(path, formats, lambda: slow_sellers_figure(data, label),
+                                                  lambda: slow_sellers_plotly(data, label))
+    elif view == "revenue_line":
+        revenue = _store.top_k("revenue", 5, (start, end)).set_index("name")["revenue"]
+        files = write_chart(path, formats, lambda: revenue_line_figure(revenue), lambda: revenue_line_plotly(revenue))
+    elif view.startswith("pie_"):
+        dimension = view[len("pie_"):]
+        counts = category_counts(_store.products, dimension)
+        title = CATEGORY_CHART_TITLES[dimension]
+        files = write_chart(path, formats, lambda: category_pie_figure(counts, title),
+                            lambda: category_pie_plotly(counts, title))
+    else:
+        raise ValueError(f"Biểu đồ không hợp lệ: {view}")
+    return view, name, files, summary
+
+
+# Hàm tạo danh sách kỳ: các kỳ chỉ định (TÊN:BẮT_ĐẦU:KẾT_THÚC) hoặc chia theo freq,
+# luôn thêm kỳ toàn bộ dữ liệu "Ca_thang" như KPI_app
+def report_periods(store, specs=None, freq="weekly"):
+    if specs:
+        periods = []
+        for spec in specs:
+            name, start, end = spec.split(":")
+            periods.append((name, pd.Timestamp(start), pd.Timestamp(end)))
+        return periods
+    periods = [(f"Tuan_{i}" if freq == "weekly" else slugify(label), start, end)
+               for i, (label, start, end) in enumerate(make_periods(store.first_date, store.last_date, freq), start=1)]
+    periods.append(("Ca_thang", store.first_date, store.last_date))
+    return periods
+
+
+# Hàm ghi trang index.html: bảng KPI của từng kỳ và liên kết tới các biểu đồ
+def write_index(out_dir, source, periods, results):
+    rows, sections = [], []
+    for name, start, end in periods:
+        kpi = results.get((name, "kpi"), {}).get("summary", {})
+        rows.append(
+            f"<tr><td><a href='#{slugify(name)}'>{html.escape(name)}</a></td>"
+            f"<td>{start:%d/%m/%Y} → {end:%d/%m/%Y}</td>"
+            f"<td>{int(kpi.get('total_revenue', 0)):,} VNĐ</td><td>{int(kpi.get('total_units', 0)):,}</td>"
+            f"<td>{html.escape(str(kpi.get('top_product') or ''))}</td>"
+            f"<td>{format_growth(kpi.get('growth'))}</td></tr>")
+        sections.append(f"<h2 id='{slugify(name)}'>{html.escape(name)}</h2>")
+        for view in PERIOD_VIEWS:
+            for file in results.get((name, view), {}).get("files", []):
+                sections.append(_file_link(out_dir, file))
+
+    for key, value in results.items():
+        if key[0] is None:
+            sections.append(f"<h2>{html.escape(CATEGORY_CHART_TITLES[key[1][len('pie_'):]])}</h2>")
+            sections.extend(_file_link(out_dir, file) for file in value["files"])
+
+    page = f"""<!DOCTYPE html>
+<html lang="vi"><head><meta charset="utf-8"><title>Báo cáo kinh doanh cà phê</title>
+<style>body{{font-family:sans-serif;margin:2em}} table{{border-collapse:collapse}}
+td,th{{border:1px solid #ccc;padding:4px 8px}} img{{max-width:100%;margin:8px 0}}</style></head>
+<body><h1>☕ Báo cáo kinh doanh cà phê</h1>
+<p>Nguồn: {html.escape(source)} — tạo lúc {time.strftime("%d/%m/%Y %H:%M")}</p>
+<table><tr><th>Kỳ</th><th>Khoảng ngày</th><th>Tổng doanh thu</th><th>Sản phẩm bán ra</th>
+<th>Doanh thu cao nhất</th><th>Tăng trưởng</th></tr>
+{"".join(rows)}</table>
+{"".join(sections)}
+</body></html>"""
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(page)
+
+
+def _file_link(out_dir, file):
+    rel = html.escape(os.path.relpath(file, out_dir).replace(os.sep, "/"))
+    if file.endswith(".png"):
+        return f"<div><img src='{rel}' alt='{rel}'></div>"
+    return f"<div><a href='{rel}'>{rel}</a></div>"
+
+
+# Hàm tạo báo cáo tĩnh: ingest một lần, rồi vẽ song song mọi biểu đồ của mọi kỳ
+def build_report(source, out_dir, periods=None, freq="weekly", formats=REPORT_FORMATS, workers=None):
+    store = AggregateStore(*ingest_file(os.path.abspath(source))).freeze()
+    periods = report_periods(store, periods, freq)
+
+    tasks = []
+    for name, start, end in periods:
+        period_dir = os.path.join(out_dir, slugify(name))
+        os.makedirs(period_dir, exist_ok=True)
+        tasks.extend((view, name, start, end, period_dir, formats) for view in PERIOD_VIEWS)
+    # Biểu đồ tròn đếm số sản phẩm, không phụ thuộc kỳ nên chỉ vẽ một lần
+    os.makedirs(out_dir, exist_ok=True)
+    tasks.extend((f"pie_{dimension}", None, None, None, out_dir, formats) for dimension in CATEGORY_CHART_TITLES)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store,)) as pool:
+        for view, name, files, summary in pool.map(render_task, tasks):
+            results[(name, view)] = {"files": files, "summary": summary}
+    write_index(out_dir, source, periods, results)
+    return results
+
+
+# Tạo báo cáo tĩnh không cần Streamlit, ví dụ:
+#   python report.py "kf_coffee (1).xlsx" --out report
+#   python report.py kf_coffee.csv --period Tuan_1:2025-03-07:2025-03-14 --period Ca_thang:2025-03-07:2025-03-28
+def main():
+    parser = argparse.ArgumentParser(description="Xuất báo cáo KPI, top 10, bán chậm, doanh thu, phân phối")
+    parser.add_argument("source", nargs="?", default="kf_coffee (1).xlsx", help="File dữ liệu (CSV/Excel)")
+    parser.add_argument("--out", default="report", help="Thư mục báo cáo")
+    parser.add_argument("--period", action="append", dest="periods",
+                        help="Kỳ dạng TÊN:YYYY-MM-DD:YYYY-MM-DD (lặp lại được)")
+    parser.add_argument("--freq", default="weekly", choices=["daily", "weekly", "monthly"],
+                        help="Cách chia kỳ khi không chỉ định --period")
+    parser.add_argument("--format", nargs="+", default=REPORT_FORMATS, choices=REPORT_FORMATS, dest="formats")
+    parser.add_argument("--workers", type=int, help="Số tiến trình vẽ (mặc định: số CPU)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = build_report(args.source, args.out, args.periods, args.freq, args.formats, args.workers)
+    n_files = sum(len(r["files"]) for r in results.values())
+    print(f"Đã ghi {n_files} file vào {args.out}/ trong {time.perf_counter() - start:.1f}s "
+          f"(mở {os.path.join(args.out, 'index.html')})")
+
+
+if __name__ == "__main__":
+    main()
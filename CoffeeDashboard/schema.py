@@ -0,0 +1,163 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Ngày gốc để lưu ngày dạng số nguyên (số ngày kể từ 1970-01-01)
+EPOCH = pd.Timestamp("1970-01-01")
+
+# Giá trị cột day của các mục có ngày lỗi
+MISSING_DAY = np.iinfo(np.int32).min
+
+# Các cột chuỗi lặp lại nhiều lần được lưu dạng Categorical
+# (tên sản phẩm gần như không lặp lại nên giữ dạng chuỗi thường)
+CATEGORICAL_COLUMNS = ["packaging", "coffee_type", "store"]
+
+
+# Hàm thu hẹp một cột số không làm đổi giá trị: số nguyên (kể cả số thực toàn giá trị nguyên
+# như "28.0") về kiểu nguyên nhỏ nhất chứa được, số thực còn lại về float32 nếu biểu diễn đúng
+def narrow_numeric(values):
+    if pd.api.types.is_bool_dtype(values) or not pd.api.types.is_numeric_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast="integer")
+    array = values.to_numpy(dtype=np.float64)
+    if np.isfinite(array).all() and np.array_equal(array, np.round(array)) \
+            and np.abs(array).max(initial=0) < 2 ** 31:
+        return pd.to_numeric(pd.Series(array.astype(np.int64), index=values.index, name=values.name),
+                             downcast="integer")
+    narrow = array.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), array, equal_nan=True):
+        return pd.Series(narrow, index=values.index, name=values.name)
+    return values
+
+
+# Hàm đổi bảng sản phẩm sang dạng gọn: product_id int32, các cột nhóm dạng Categorical,
+# các cột số thu hẹp bằng narrow_numeric
+def compact_products(products):
+    products = products.copy()
+    for column in products.columns:
+        if column == "product_id":
+            products[column] = products[column].to_numpy(dtype=np.int32)
+        elif column in CATEGORICAL_COLUMNS:
+            products[column] = products[column].astype("category")
+        else:
+            products[column] = narrow_numeric(products[column])
+    return products
+
+
+# Hàm đổi bảng biến động sang dạng gọn: cột date thay bằng day (số ngày kể từ EPOCH, int32,
+# MISSING_DAY khi ngày lỗi), product_id int32, số lượng thu hẹp bằng narrow_numeric
+def compact_movements(movements):
+    days, valid = movement_days(movements)
+    compact = pd.DataFrame({
+        "product_id": movements["product_id"].to_numpy(dtype=np.int32),
+        "day": np.where(valid, days, MISSING_DAY).astype(np.int32),
+    })
+    for column in movements.columns.drop(["product_id", "date", "day"], errors="ignore"):
+        if column in CATEGORICAL_COLUMNS:
+            compact[column] = pd.Categorical(movements[column])
+        else:
+            compact[column] = narrow_numeric(movements[column].reset_index(drop=True))
+    return compact
+
+
+def compact_dataset(products, movements):
+    return compact_products(products), compact_movements(movements)
+
+
+# Hàm nối các bảng cùng cột (ví dụ các khối đã đổi sang dạng gọn) mà vẫn giữ kiểu Categorical:
+# các khối có tập nhóm khác nhau được đưa về chung một tập nhóm trước khi nối
+# narrow=True: các khối đã thu hẹp bằng narrow_numeric; cột số có kiểu khác nhau giữa các khối
+# (bị nâng kiểu khi nối) được thu hẹp lại trên cả cột, cho cùng kiểu với khi thu hẹp một lần
+def concat_tables(frames, narrow=False):
+    frames = list(frames)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([frame[column] for frame in frames]).categories
+            frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    table = pd.concat(frames, ignore_index=True)
+    if narrow:
+        for column in table.columns:
+            if len({str(frame[column].dtype) for frame in frames}) > 1:
+                table[column] = narrow_numeric(table[column])
+    return table
+
+
+# Hàm lấy ngày của từng dòng biến động dạng số ngày kể từ EPOCH (int64) kèm mặt nạ ngày hợp lệ
+# Dùng được cho cả bảng gọn (cột day) lẫn bảng cũ (cột date)
+def movement_days(movements):
+    if "day" in movements:
+        days = movements["day"].to_numpy(dtype=np.int64)
+        return days, days != MISSING_DAY
+    dates = pd.DatetimeIndex(movements["date"]).normalize()
+    valid = ~dates.isna()
+    days = np.zeros(len(dates), dtype=np.int64)
+    days[valid] = (dates[valid] - EPOCH) // pd.Timedelta(days=1)
+    return days, np.asarray(valid)
+
+
+# Hàm lấy ngày của từng dòng biến động dạng datetime (NaT khi ngày lỗi)
+def movement_dates(movements):
+    if "date" in movements:
+        return movements["date"]
+    days, valid = movement_days(movements)
+    dates = EPOCH + pd.to_timedelta(np.where(valid, days, 0), unit="D")
+    return pd.Series(dates.where(valid), index=movements.index, name="date")
+
+
+# Hàm đổi ngày thành số ngày kể từ EPOCH
+def day_offset(date):
+    return (pd.Timestamp(date).normalize() - EPOCH).days
+
+
+# Hàm so sánh bộ nhớ (byte, tính cả chuỗi) của bảng dạng cũ và dạng gọn, theo từng cột
+def memory_report(products, movements):
+    rows = []
+    for table, old, new in [("products", products, compact_products(products)),
+                            ("movements", movements, compact_movements(movements))]:
+        old_usage = old.memory_usage(index=False, deep=True)
+        new_usage = new.memory_usage(index=False, deep=True)
+        for column in old.columns:
+            target = "day" if column == "date" and "day" in new else column
+            rows.append({"table": table, "column": column, "old_dtype": str(old[column].dtype),
+                         "new_dtype": str(new[target].dtype) if target in new else None,
+                         "old_bytes": int(old_usage[column]), "new_bytes": int(new_usage.get(target, 0))})
+    report = pd.DataFrame(rows)
+    totals = report.groupby("table", sort=False)[["old_bytes", "new_bytes"]].sum().reset_index()
+    totals["column"] = "(tổng)"
+    report = pd.concat([report, totals, pd.DataFrame([{
+        "table": "(tất cả)", "column": "(tổng)",
+        "old_bytes": int(report["old_bytes"].sum()), "new_bytes": int(report["new_bytes"].sum())}])],
+        ignore_index=True)
+    report["ratio"] = report["old_bytes"] / report["new_bytes"].where(report["new_bytes"] > 0)
+    return report
+
+
+# In báo cáo bộ nhớ của một file dữ liệu (hoặc dữ liệu giả của benchmark), ví dụ:
+#   python schema.py kf_coffee.csv
+#   python schema.py --synthetic 10000x90
+def main():
+    from benchmark import make_synthetic
+    from ingest import ingest
+    from data_loader import read_source
+
+    parser = argparse.ArgumentParser(description="So sánh bộ nhớ của dạng dữ liệu cũ và dạng gọn")
+    parser.add_argument("source", nargs="?", default="kf_coffee (1).xlsx")
+    parser.add_argument("--synthetic", help="Dùng dữ liệu giả <số sản phẩm>x<số ngày> thay cho file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        n_products, n_days = (int(x) for x in args.synthetic.lower().split("x"))
+        df, label = make_synthetic(n_products, n_days), f"dữ liệu giả {args.synthetic}"
+    else:
+        df, label = read_source(args.source), os.path.basename(args.source)
+    report = memory_report(*ingest(df))
+    report[["old_kb", "new_kb"]] = report[["old_bytes", "new_bytes"]] / 1024
+    print(f"Bộ nhớ theo cột ({label}):")
+    print(report.drop(columns=["old_bytes", "new_bytes"]).to_string(index=False, float_format=lambda x: f"{x:,.1f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from diagnostics import instrument
+
+# Các cách nhóm sản phẩm khi tính phân vị
+SLOW_SELLER_DIMENSIONS = {
+    "coffee_type": "Theo loại cà phê",
+    "packaging": "Theo loại bao bì",
+    None: "Toàn bộ sản phẩm",
+}
+
+
+# Hàm tìm sản phẩm bán chậm trong khoảng [start, end] (None = toàn thời gian)
+# - velocity: số lượng bán trung bình mỗi ngày trong khoảng
+# - percentile: phân vị của velocity trong nhóm (dimension) của sản phẩm, 0-100
+# Sản phẩm bị đánh dấu khi velocity không vượt quá ngưỡng phân vị `percentile` của nhóm;
+# chỉ k sản phẩm chậm nhất được chọn bằng argpartition, không sắp xếp toàn bộ danh mục
+# exclude_zero: bỏ qua sản phẩm không bán được gì (thường là ngừng kinh doanh/hết hàng)
+@instrument("slow_sellers")
+def find_slow_sellers(store, start=None, end=None, k=10, dimension="coffee_type",
+                      percentile=25, exclude_zero=True):
+    totals = store.product_totals(start, end)
+    first = store.first_date if start is None else pd.Timestamp(start)
+    last = store.last_date if end is None else pd.Timestamp(end)
+    days = max((last - first).days + 1, 1)
+
+    units = totals["units"].to_numpy(dtype=np.float64)
+    velocity = units / days
+    if dimension is None:
+        codes = np.zeros(len(totals), dtype=np.int64)
+        labels = pd.Index(["Toàn bộ"])
+    else:
+        codes, labels = pd.factorize(store.products[dimension], use_na_sentinel=False)
+
+    candidates = velocity > 0 if exclude_zero else np.ones(len(velocity), dtype=bool)
+    if not candidates.any():
+        return _empty_result()
+
+    # Ngưỡng phân vị của từng nhóm (np.percentile dùng partition, không sắp xếp toàn bộ)
+    cutoffs = np.full(len(labels), -np.inf)
+    for code in np.unique(codes[candidates]):
+        cutoffs[code] = np.percentile(velocity[candidates & (codes == code)], percentile)
+    flagged = np.flatnonzero(candidates & (velocity <= cutoffs[codes]))
+    if flagged.size == 0:
+        return _empty_result()
+
+    # Chọn k sản phẩm chậm nhất trong số bị đánh dấu rồi chỉ sắp xếp k sản phẩm đó
+    k = min(max(int(k), 0), flagged.size)
+    if k == 0:
+        return _empty_result()
+    chosen = flagged[np.argpartition(velocity[flagged], k - 1)[:k]] if k < flagged.size else flagged
+    chosen = chosen[np.lexsort((chosen, velocity[chosen]))]
+
+    # Phân vị trong nhóm: tỷ lệ sản phẩm cùng nhóm có velocity không lớn hơn
+    same_group = codes[candidates][None, :] == codes[chosen][:, None]
+    not_faster = velocity[candidates][None, :] <= velocity[chosen][:, None]
+    group_sizes = np.bincount(codes[candidates], minlength=len(labels))[codes[chosen]]
+    rank_pct = (same_group & not_faster).sum(axis=1) / group_sizes * 100
+
+    return pd.DataFrame({
+        "product_id": totals["product_id"].to_numpy()[chosen],
+        "name": totals["name"].to_numpy()[chosen],
+        "group": np.asarray(labels)[codes[chosen]],
+        "units": units[chosen],
+        "velocity": velocity[chosen],
+        "percentile": rank_pct,
+    })
+
+
+def _empty_result():
+    return pd.DataFrame({
+        "product_id": pd.Series(dtype=np.int64),
+        "name": pd.Series(dtype=object),
+        "group": pd.Series(dtype=object),
+        "units": pd.Series(dtype=np.float64),
+        "velocity": pd.Series(dtype=np.float64),
+        "percentile": pd.Series(dtype=np.float64),
+    })
@@ -0,0 +1,244 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CATEGORY_COLUMNS, QueryCache, make_periods
+from categories import classify_products
+from diagnostics import instrument
+from schema import EPOCH, day_offset, movement_days
+
+# Hậu tố file CSDL SQLite đặt cạnh file nguồn
+SQLITE_SUFFIX = ".sqlite"
+
+# Số dòng ghi vào CSDL mỗi lần
+SQLITE_BATCH_ROWS = 100000
+
+METRIC_EXPRESSIONS = {
+    "units": "units",
+    "revenue": "units * p.price",
+}
+
+
+# Hàm ghi bảng sản phẩm và bảng biến động vào CSDL SQLite, kèm chữ ký của file nguồn
+# Ghi ra file tạm rồi đổi tên để tiến trình khác không đọc phải CSDL ghi dở
+def write_database(db_path, signature, products, movements):
+    tmp = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT INTO meta VALUES ('signature', ?)", (signature,))
+        # Kiểu của product_id trong bảng nguồn (int32 khi dùng dạng gọn), để kết quả truy vấn
+        # có cùng kiểu với kho tổng hợp DataFrame
+        conn.execute("INSERT INTO meta VALUES ('product_id_dtype', ?)", (str(products["product_id"].dtype),))
+
+        # Giá thiếu được tính là 0, giống kho tổng hợp DataFrame
+        table = products.reset_index(drop=True)
+        table = table.assign(**{c: table[c].astype(str) for c in CATEGORY_COLUMNS if c in table})
+        if "name" in table:
+            table["name"] = table["name"].astype(object)
+        table.insert(0, "position", np.arange(len(table), dtype=np.int64))
+        table["price"] = pd.to_numeric(table.get("price", 0.0), errors="coerce").fillna(0.0)
+        table.to_sql("products", conn, index=False)
+
+        days, valid = movement_days(movements)
+        pd.DataFrame({
+            "product_id": movements["product_id"].to_numpy(dtype=np.int64),
+            "day": pd.arrays.IntegerArray(days, ~valid),
+            "stock_increased": movements["stock_increased"].to_numpy(dtype=np.float64),
+            "units": movements["stock_decreased"].to_numpy(dtype=np.float64),
+        }).to_sql("movements", conn, index=False, chunksize=SQLITE_BATCH_ROWS)
+        conn.execute("CREATE INDEX idx_movements_product_day ON movements (product_id, day)")
+        conn.execute("CREATE UNIQUE INDEX idx_products_product_id ON products (product_id)")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, db_path)
+
+
+# Hàm đọc chữ ký đã lưu trong CSDL, None nếu chưa có CSDL hoặc CSDL hỏng
+def database_signature(db_path):
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+# Hàm mở kho SQLite; CSDL được dựng lại (bằng build_dataset) khi chữ ký nguồn thay đổi
+@instrument("sqlite_open")
+def open_sql_store(db_path, signature, build_dataset):
+    if database_signature(db_path) != signature:
+        write_database(db_path, signature, *build_dataset())
+    return SQLiteStore(db_path)
+
+
+# Kho truy vấn trên CSDL SQLite: cùng giao diện truy vấn với AggregateStore
+# (product_totals, top_k, category_totals) nhưng bảng biến động nằm trên đĩa,
+# mỗi truy vấn là một phép SUM ... GROUP BY dùng chỉ mục (product_id, day)
+# Chỉ bảng sản phẩm (nhỏ) được giữ trong bộ nhớ
+class SQLiteStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._cache = QueryCache()
+
+        products = pd.read_sql("SELECT * FROM products ORDER BY position", self._connection())
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'product_id_dtype'").fetchone()
+        products["product_id"] = products["product_id"].astype(row[0] if row else np.int64)
+        self.products = classify_products(products.drop(columns="position"))
+        self.price = self.products["price"].to_numpy(dtype=np.float64)
+
+        first, last = self._connection().execute("SELECT MIN(day), MAX(day) FROM movements").fetchone()
+        if first is None:
+            self.first_date = self.last_date = pd.Timestamp.today().normalize()
+        else:
+            self.first_date = EPOCH + pd.Timedelta(days=first)
+            self.last_date = EPOCH + pd.Timedelta(days=last)
+
+    # Mỗi luồng dùng một kết nối chỉ đọc riêng
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    # Hàm đổi (start, end) thành điều kiện ngày, None = toàn thời gian (kể cả ngày lỗi)
+    def _bounds(self, start, end):
+        if start is None and end is None:
+            return None
+        lo = day_offset(self.first_date if start is None else start)
+        hi = day_offset(self.last_date if end is None else end)
+        return lo, hi
+
+    # Câu truy vấn số lượng bán của từng sản phẩm (position, units) trong khoảng ngày
+    def _units_query(self, bounds, where=""):
+        condition = "" if bounds is None else "AND m.day BETWEEN ? AND ?"
+        sql = (f"SELECT p.position, COALESCE(SUM(m.units), 0.0) AS units FROM products p "
+               f"LEFT JOIN movements m ON m.product_id = p.product_id {condition} "
+               f"{where} GROUP BY p.position")
+        return sql, [] if bounds is None else list(bounds)
+
+    # Số lượng bán và doanh thu của từng sản phẩm trong khoảng ngày (None = toàn thời gian)
+    def product_totals(self, start=None, end=None):
+        bounds = self._bounds(start, end)
+
+        def compute():
+            sql, params = self._units_query(bounds)
+            rows = self._connection().execute(sql + " ORDER BY p.position", params).fetchall()
+            units = np.zeros(len(self.products))
+            if rows:
+                positions, values = zip(*rows)
+                units[list(positions)] = values
+            return pd.DataFrame({
+                "product_id": self.products["product_id"].to_numpy(),
+                "name": self.products["name"].to_numpy(),
+                "units": units,
+                "revenue": units * self.price,
+            })
+        return self._cache.get_or_compute(("products", bounds), compute)
+
+    # Top-k sản phẩm theo metric trong kỳ period = (start, end); category = (cột phân loại, nhãn)
+    # Sắp xếp và LIMIT chạy trong SQLite; hòa điểm xếp theo thứ tự sản phẩm như AggregateStore.top_k
+    @instrument("top_k")
+    def top_k(self, metric, k, period=None, category=None):
+        start, end = period if period is not None else (None, None)
+        bounds = self._bounds(start, end)
+
+        def compute():
+            where, params = "", []
+            if category is not None:
+                dimension, label = category
+                if dimension not in CATEGORY_COLUMNS:
+                    raise ValueError(f"Cột phân loại không hợp lệ: {dimension}")
+                where, params = f"WHERE p.{dimension} = ?", [str(label)]
+            sql, bound_params = self._units_query(bounds, where)
+            sql = (f"SELECT position, units FROM ({sql}) t JOIN products p USING (position) "
+                   f"ORDER BY {METRIC_EXPRESSIONS[metric]} DESC, position LIMIT ?")
+            rows = self._connection().execute(sql, bound_params + params + [int(k)]).fetchall()
+            positions = np.array([r[0] for r in rows], dtype=np.int64)
+            units = np.array([r[1] for r in rows], dtype=np.float64)
+            return pd.DataFrame({
+                "product_id": self.products["product_id"].to_numpy()[positions],
+                "name": self.products["name"].to_numpy()[positions],
+                "units": units,
+                "revenue": units * self.price[positions],
+            })
+        return self._cache.get_or_compute(("top", metric, bounds, category, k), compute)
+
+    # Số lượng bán và doanh thu theo từng nhóm của một cột phân loại
+    def category_totals(self, dimension, start=None, end=None):
+        if dimension not in CATEGORY_COLUMNS:
+            raise ValueError(f"Cột phân loại không hợp lệ: {dimension}")
+        bounds = self._bounds(start, end)
+
+        def compute():
+            condition = "" if bounds is None else "AND m.day BETWEEN ? AND ?"
+            sql = (f"SELECT p.{dimension}, COALESCE(SUM(m.units), 0.0), COALESCE(SUM(m.units * p.price), 0.0) "
+                   f"FROM products p LEFT JOIN movements m ON m.product_id = p.product_id {condition} "
+                   f"GROUP BY p.{dimension}")
+            rows = self._connection().execute(sql, [] if bounds is None else list(bounds)).fetchall()
+            result = pd.DataFrame(rows, columns=[dimension, "units", "revenue"]).set_index(dimension)
+            labels = pd.Index(pd.factorize(self.products[dimension], use_na_sentinel=False)[1], name=dimension)
+            return result.reindex(labels.astype(str), fill_value=0.0).set_axis(labels)
+        return self._cache.get_or_compute(("category", dimension, bounds), compute)
+
+
+# Hàm so sánh số liệu của hai bộ máy truy vấn (product_totals, top_k, category_totals) trên toàn bộ
+# dữ liệu và từng tuần; trả về danh sách các truy vấn có kết quả khác nhau (kể cả khác kiểu cột)
+def compare_engines(frame_store, sql_store, k=10):
+    periods = [(None, None)] + [(start, end) for _, start, end in
+                                make_periods(frame_store.first_date, frame_store.last_date, "weekly")]
+    queries = []
+    for start, end in periods:
+        queries.append((f"product_totals({start}, {end})", lambda s, a=start, b=end: s.product_totals(a, b)))
+        for metric in METRIC_EXPRESSIONS:
+            queries.append((f"top_k({metric}, {start}, {end})",
+                            lambda s, m=metric, a=start, b=end: s.top_k(m, k, (a, b))))
+        for dimension in CATEGORY_COLUMNS:
+            queries.append((f"category_totals({dimension}, {start}, {end})",
+                            lambda s, d=dimension, a=start, b=end: s.category_totals(d, a, b)))
+            for label in frame_store.products[dimension].unique():
+                queries.append((f"top_k(revenue, {dimension}={label}, {start}, {end})",
+                                lambda s, d=dimension, v=label, a=start, b=end: s.top_k("revenue", k, (a, b), (d, v))))
+
+    mismatches = []
+    for name, query in queries:
+        try:
+            pd.testing.assert_frame_equal(query(frame_store), query(sql_store), check_exact=False)
+        except AssertionError as e:
+            mismatches.append(f"{name}: {e}")
+    return mismatches
+
+
+# Kiểm tra hai bộ máy truy vấn cho cùng số liệu trên một file dữ liệu, ví dụ:
+#   python sql_store.py kf_coffee.csv
+def main():
+    from data_loader import load_aggregate_store, load_sql_store
+
+    parser = argparse.ArgumentParser(description="So sánh số liệu của bộ máy DataFrame và SQLite")
+    parser.add_argument("source", nargs="?", default="kf_coffee (1).xlsx")
+    args = parser.parse_args()
+
+    mismatches = compare_engines(load_aggregate_store(args.source), load_sql_store(args.source))
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} truy vấn khác nhau" if mismatches else "Hai bộ máy cho cùng số liệu")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
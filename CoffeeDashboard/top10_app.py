@@ -1,28 +1,17 @@
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-import json
 import streamlit as st
+from data_loader import load_aggregate_store
+from diagnostics import begin_app, end_app, stage
 
-# Đọc dữ liệu
-data = pd.read_csv("kf_coffee.csv")
+# Đo thời gian/bộ nhớ từng bước khi bật chẩn đoán trên sidebar
+begin_app("top10_app")
 
-# Chuẩn hóa tên cột
-data.columns = data.columns.str.strip().str.lower()
+# Đọc kho tổng hợp dựng sẵn (cache dùng chung)
+store = load_aggregate_store("kf_coffee.csv")
 
-# Hàm để tính tổng stock_decreased cho từng sản phẩm
-def total_stock_decreased(history_str):
-    try:
-        history = json.loads(history_str).get("stock_history", [])
-        return sum(float(entry.get("stock_decreased", 0)) for entry in history)
-    except:
-        return 0
-
-# Áp dụng hàm
-data["stock_decreased"] = data["stock_history"].apply(total_stock_decreased)
-
-# Nhóm và lấy top 10 sản phẩm
-top_products = data.groupby('name')['stock_decreased'].sum().sort_values(ascending=False).head(10)
+# Lấy top 10 sản phẩm (chọn bằng heap, không sắp xếp toàn bộ danh mục)
+top_products = store.top_k("units", 10).set_index('name')['units']
 
 # Vẽ biểu đồ bằng matplotlib
 fig, ax = plt.subplots(figsize=(18, 7))
@@ -38,4 +27,7 @@ ax.set_ylabel("Sản phẩm")
 plt.tight_layout()
 
 # 👉 Hiển thị biểu đồ lên Streamlit
-st.pyplot(fig)
+with stage("render"):
+    st.pyplot(fig)
+
+end_app()
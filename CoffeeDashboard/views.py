@@ -0,0 +1,228 @@
+import matplotlib.pyplot as plt
+import pandas as pd
+import plotly.graph_objects as go
+import seaborn as sns
+
+from categories import CATEGORY_COLORS
+from charts import SET2_COLORS, WEBGL_MIN_POINTS, bar_figure, line_figure
+
+# Tiêu đề biểu đồ tròn theo cột phân loại
+CATEGORY_CHART_TITLES = {
+    "packaging": "Phân phối sản phẩm theo loại bao bì",
+    "coffee_type": "Phân phối sản phẩm theo loại cà phê",
+}
+
+
+# Hàm tính số liệu KPI của kỳ [start, end]: tổng doanh thu, số lượng bán, top k theo doanh thu,
+# sản phẩm doanh thu cao nhất và tăng trưởng số lượng bán so với kỳ liền trước cùng độ dài
+def kpi_summary(store, start, end, k=10):
+    totals = store.product_totals(start, end)
+    total_units = float(totals["units"].sum())
+    top_products = store.top_k("revenue", k, (start, end))
+
+    period_days = pd.Timedelta(days=(pd.Timestamp(end) - pd.Timestamp(start)).days + 1)
+    prev_units = store.product_totals(pd.Timestamp(start) - period_days,
+                                      pd.Timestamp(start) - pd.Timedelta(days=1))["units"].sum()
+    growth = (total_units - prev_units) / prev_units * 100 if prev_units > 0 else None
+    return {
+        "total_revenue": float(totals["revenue"].sum()),
+        "total_units": total_units,
+        "top_product": top_products.iloc[0]["name"] if len(top_products) else None,
+        "growth": growth,
+        "top_products": top_products,
+    }
+
+
+# Hàm định dạng tăng trưởng như thẻ KPI
+def format_growth(growth):
+    return "N/A" if growth is None else f"{growth:+.1f}%"
+
+
+# Biểu đồ cột top sản phẩm theo doanh thu (bảng có cột name, revenue)
+def kpi_figure(top_products):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    bars = ax.bar(top_products["name"], top_products["revenue"], color="#4CAF50")
+    ax.set_ylabel("Doanh thu (VNĐ)")
+    ax.set_xticklabels(top_products["name"], rotation=45, ha='right')
+
+    # Thêm số liệu lên từng cột
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, height + 0.01 * height,
+                f"{int(height):,}", ha='center', va='bottom', fontsize=10, fontweight='bold')
+    return fig
+
+
+def kpi_plotly(top_products):
+    return bar_figure(top_products["name"], top_products["revenue"],
+                      text=[f"{int(v):,}" for v in top_products["revenue"]],
+                      color="#4CAF50", ylabel="Doanh thu (VNĐ)")
+
+
+# Biểu đồ cột ngang top sản phẩm bán chạy (Series số lượng bán, index là tên)
+def top10_figure(top_products):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.barplot(x=top_products.values, y=top_products.index, palette='viridis', ax=ax)
+
+    for i, v in enumerate(top_products.values):
+        ax.text(v + 5, i, str(int(v)), color='black', va='center', fontweight='bold')
+
+    ax.set_xlabel("Số lượng bán")
+    ax.set_ylabel("Sản phẩm")
+    return fig
+
+
+def top10_plotly(top_products):
+    return bar_figure(top_products.index, top_products.values, horizontal=True,
+                      text=[str(int(v)) for v in top_products.values], colorscale="Viridis",
+                      xlabel="Số lượng bán", ylabel="Sản phẩm")
+
+
+# Biểu đồ sản phẩm bán chậm (kết quả find_slow_sellers), period là nhãn khoảng ngày
+def slow_sellers_figure(data, period):
+    fig, ax = plt.subplots(figsize=(10, 5))
+    sns.barplot(data=data, x="units", y="name", palette="Set2", ax=ax)
+
+    for i, (v, pct) in enumerate(zip(data["units"], data["percentile"])):
+        ax.text(v + 0.2, i, f"{int(v)} (P{pct:.0f})", va='center', color='black', fontweight='bold')
+
+    ax.set_xlabel(f"Số lượng bán ({period})")
+    ax.set_ylabel("Tên sản phẩm")
+    return fig
+
+
+def slow_sellers_plotly(data, period):
+    labels = [f"{int(v)} (P{pct:.0f})" for v, pct in zip(data["units"], data["percentile"])]
+    return bar_figure(data["name"], data["units"], horizontal=True, text=labels, palette=SET2_COLORS,
+                      xlabel=f"Số lượng bán ({period})", ylabel="Tên sản phẩm")
+
+
+# Biểu đồ đường doanh thu top sản phẩm (Series doanh thu, index là tên)
+def revenue_line_figure(revenue_by_product):
+    fig, ax = plt.subplots(figsize=(20, 10), facecolor="#F5F5F5")
+    sns.set_style("whitegrid")
+
+    # Vẽ đường chính
+    sns.lineplot(x=revenue_by_product.index, y=revenue_by_product.values, marker='o',
+                 markersize=15, linestyle='-', linewidth=3, color='#2196F3',
+                 markeredgecolor='black', markeredgewidth=1, ax=ax)
+
+    # Vẽ bóng nền
+    sns.lineplot(x=revenue_by_product.index, y=revenue_by_product.values, marker='o',
+                 markersize=12, linestyle='-', linewidth=5, color='#BBDEFB', alpha=0.5, ax=ax)
+
+    # Thêm nhãn số lên điểm
+    for i, (x, y) in enumerate(zip(revenue_by_product.index, revenue_by_product.values)):
+        ax.text(i, y + y*0.01, f"{int(y):,} VNĐ", ha='center', va='bottom',
+                fontsize=12, fontweight='bold', color='#4CAF50')
+
+    # Tùy chỉnh biểu đồ
+    ax.set_title("Doanh Thu Top 5 Sản Phẩm (Line Chart)", fontsize=18, fontweight='bold', pad=20, color='#333333')
+    ax.set_xlabel("Sản Phẩm", fontsize=14, fontweight='bold', color='#333333')
+    ax.set_ylabel("Doanh Thu (VNĐ)", fontsize=14, fontweight='bold', color='#333333')
+    ax.set_xticklabels(revenue_by_product.index, rotation=45, fontsize=12, fontweight='bold', color='#333333')
+    ax.tick_params(axis='y', labelsize=12)
+
+    # Viền khung biểu đồ
+    for spine in ax.spines.values():
+        spine.set_color('#B0BEC5')
+        spine.set_linewidth(1.5)
+
+    # Đường lưới
+    ax.yaxis.grid(True, linestyle='--', color='#E0E0E0', alpha=0.7)
+    ax.xaxis.grid(False)
+    return fig
+
+
+def revenue_line_plotly(revenue_by_product):
+    return line_figure(revenue_by_product.index, revenue_by_product.values,
+                       text=[f"{int(y):,} VNĐ" for y in revenue_by_product.values],
+                       title="Doanh Thu Top 5 Sản Phẩm (Line Chart)",
+                       xlabel="Sản Phẩm", ylabel="Doanh Thu (VNĐ)")
+
+
+# Biểu đồ tồn kho theo ngày (bảng ngày × tên sản phẩm từ InventoryLevels.history)
+def inventory_figure(history):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    for name in history.columns:
+        ax.plot(history.index, history[name], marker='o', linewidth=2, label=name)
+    ax.axhline(0, color='#F44336', linestyle='--', linewidth=1)
+    ax.set_xlabel("Ngày")
+    ax.set_ylabel("Tồn kho cuối ngày")
+    ax.legend(fontsize=9, loc="upper left", bbox_to_anchor=(1, 1))
+    fig.autofmt_xdate()
+    return fig
+
+
+def inventory_plotly(history):
+    trace = go.Scattergl if history.size >= WEBGL_MIN_POINTS else go.Scatter
+    fig = go.Figure(data=[trace(x=history.index, y=history[name], mode="lines+markers", name=name)
+                          for name in history.columns])
+    fig.add_hline(y=0, line=dict(color="#F44336", dash="dash", width=1))
+    fig.update_layout(xaxis_title="Ngày", yaxis_title="Tồn kho cuối ngày", height=500,
+                      plot_bgcolor="#F5F5F5", legend=dict(font=dict(size=11)))
+    fig.update_yaxes(gridcolor="#E0E0E0", griddash="dash")
+    return fig
+
+
+# Biểu đồ số lượng bán theo ngày và dự báo (hai bảng ngày × tên sản phẩm cùng cột)
+def forecast_figure(history, forecast):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    for name in history.columns:
+        line, = ax.plot(history.index, history[name], marker='o', linewidth=2, label=name)
+        ax.plot(forecast.index, forecast[name], marker='o', linewidth=2, linestyle='--', color=line.get_color())
+    ax.axvline(forecast.index[0], color='#9E9E9E', linestyle=':', linewidth=1)
+    ax.set_xlabel("Ngày")
+    ax.set_ylabel("Số lượng bán (nét đứt: dự báo)")
+    ax.legend(fontsize=9, loc="upper left", bbox_to_anchor=(1, 1))
+    fig.autofmt_xdate()
+    return fig
+
+
+def forecast_plotly(history, forecast):
+    fig = go.Figure()
+    for i, name in enumerate(history.columns):
+        color = SET2_COLORS[i % len(SET2_COLORS)]
+        fig.add_trace(go.Scatter(x=history.index, y=history[name], mode="lines+markers", name=name,
+                                 legendgroup=name, line=dict(color=color)))
+        fig.add_trace(go.Scatter(x=forecast.index, y=forecast[name], mode="lines+markers", name=f"{name} (dự báo)",
+                                 legendgroup=name, showlegend=False, line=dict(color=color, dash="dash")))
+    fig.add_vline(x=forecast.index[0], line=dict(color="#9E9E9E", dash="dot", width=1))
+    fig.update_layout(xaxis_title="Ngày", yaxis_title="Số lượng bán (nét đứt: dự báo)", height=500,
+                      plot_bgcolor="#F5F5F5", legend=dict(font=dict(size=11)))
+    fig.update_yaxes(gridcolor="#E0E0E0", griddash="dash")
+    return fig
+
+
+# Biểu đồ tròn số sản phẩm theo nhóm (Series đếm từ category_counts)
+def category_pie_plotly(counts, title):
+    labels = list(counts.index)
+    fig = go.Figure(
+        data=[go.Pie(
+            labels=labels,
+            values=counts.tolist(),
+            textinfo='label+percent',
+            hoverinfo='label+value',
+            marker=dict(colors=[CATEGORY_COLORS[label] for label in labels]),
+            insidetextorientation='radial',
+            textfont=dict(size=18)  # 👉 Cỡ chữ bên trong biểu đồ
+        )]
+    )
+
+    fig.update_layout(
+        title=title,
+        showlegend=True,
+        legend=dict(font=dict(size=22))# 👉 Cỡ chữ phần chú thích
+    )
+    return fig
+
+
+# Bản matplotlib của biểu đồ tròn, dùng khi cần ảnh PNG tĩnh (Plotly cần kaleido để xuất ảnh)
+def category_pie_figure(counts, title):
+    labels = list(counts.index)
+    fig, ax = plt.subplots(figsize=(8, 8))
+    ax.pie(counts.tolist(), labels=labels, colors=[CATEGORY_COLORS[label] for label in labels],
+           autopct="%1.1f%%", startangle=90, counterclock=False, textprops=dict(fontsize=12))
+    ax.set_title(title, fontsize=14)
+    ax.axis("equal")
+    return fig